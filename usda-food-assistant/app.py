@@ -1,95 +1,85 @@
 import chainlit as cl
+import asyncio
 import logging
-from openai import AsyncOpenAI
-from pinecone.grpc import PineconeGRPC as Pinecone
-
-client = AsyncOpenAI()
-pc = Pinecone()
-index_name = "branded-food-data"
-index = pc.Index(index_name)
-
-def get_food_nutrients(data):
-    food_data = []
-    for doc in data:
-        food_info = {
-            "Food Name": doc['metadata'].get("FOOD_NAME", "Unknown Food Name"),
-            "Nutrients": doc['metadata']
-        }
-        food_data.append(food_info)
-    return food_data
-
-def generate_prompt(query, food_data):
-    formatted_food_data = "\n".join(
-        [f"- Food Name: {food['Food Name']}\n  Nutrients:\n    " +
-         "\n    ".join([f"{key}: {value}" for key, value in food['Nutrients'].items()])
-         for food in food_data]
-    )
-
-    prompt_template = f"""
-
-    Answer the user's query: {query}
-
-    Using the food data information provided. Not all data will be required to properly answer the user's query. Only use the data for the food which they are asking about. Don't interpolate information.
-    For example, if the user asks about potential allergens, answer analytically, using the information available to you to cite the source. You have data from the USDA FoodData Central Dataset loaded into your context, which is food data directly from food labels, which ensures accuracy. Therefore, there is no need to advise the user to "always check the back of the packaging for the most up-to-date information," as the data provided comes from reliable sources, including public and private USDA data gathering methods.
-
-    Nutrient values are provided as concentrations per 100 grams of the edible portion of the food. If a nutrient value is listed as 0.0, it indicates that the nutrient is present in such a small quantity that it falls below the detectable limit (Limit of Quantification (LOQ)). DO NOT use square brackets in your LaTeX equations.
-
-    Serving size information is available, but nutrient data is consistently expressed per 100 grams/milliliters. If the user asks for serving size data, provide the available information, but clarify that the nutrient values themselves are not based on the serving size.
-
-    The user may input their question about a very specific branded food item, or a more general food item, such as an ingredient. In the case where they ask about a specific branded food item by name, use only the data associated with that food item. In the case where the user asks about a general food, you'll have data for multiple brands of that food produce available in your context, therefore choose the most general version of that product in that case or average over the nutrient data to provide the average general food ingredient in that case.
-
-    If the context provided isn't enough to accurately answer the question, reply with "I'm sorry, I don't have enough information to accurately answer that question."
-    For example, if a user asks about "Original Oreos", but the data which gets retrieved is for "Original Cookies" in that case, mention that you don't have enough information
-    to accurately answer the questions about Original Oreos. Would you like me to provide general nutritional information for Original Cookies instead?". But obviously adapt
-    that to the food the user has actually entered.
-
-    Make sure to start the response by mentioning the item you are referring to:
-
-    Food Data: {formatted_food_data}
-        
-    Important: The first message the user will provide is just the food item. You should respond with something like "Loaded ingredient and nutrient data for [FOOD_NAME]. Heres's some basic information: [Give some basic information about the food]. For more detailed information, please begin asking your questions. And then list out some example questions in italics such as "Does this food contain any allergens?, "Give me a detailed nutrient breakdown, including micronutrients such as vitamins and minerals.", "I have 250 grams of this food, how many calories is that, and how many grams of sugar in that amount?"
-    Additionally, when appropriate, make good use of markdown formatting, such as tables, headings, bolding and italics when presenting the information to the user to make the experience visually appealing. Very important, if displaying in-line equations wrap the equations in single dollar signs $ In-line LaTex Equation Here $, and for larger, more visual equations, use double dollar signs $$ Larger more visual Multi-Line LaTeX Equation Here $$. DO NOT use square brackets in your LaTeX equations.
-    """
-    return prompt_template
+import os
+import time
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+from retrieval import create_call_runner, create_retriever
+from remote_calls import RemoteCallRejected
+from query_cache import DEFAULT_CACHE_SIZE, DEFAULT_CACHE_TTL_SECONDS, DEFAULT_DISK_CACHE_SIZE, QueryCache
+from prompt_builder import DEFAULT_CONTEXT_TOKEN_BUDGET, build_system_prompt, count_message_tokens, count_tokens
+
+INDEX_VERSION_CHECK_SECONDS = 60
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", DEFAULT_CONTEXT_TOKEN_BUDGET))
+OPENAI_MAX_CONCURRENCY = int(os.environ.get("OPENAI_MAX_CONCURRENCY", 64))
+OPENAI_TIMEOUT_SECONDS = float(os.environ.get("OPENAI_TIMEOUT_SECONDS", 60))
+BUSY_MESSAGE = "The assistant is handling a lot of requests right now. Please try again in a moment."
+
+# One pooled HTTP client shared by every session; completions beyond OPENAI_MAX_CONCURRENCY wait for a free slot.
+client = AsyncOpenAI(
+    timeout=OPENAI_TIMEOUT_SECONDS,
+    max_retries=2,
+    http_client=DefaultAsyncHttpxClient(limits=httpx.Limits(max_connections=OPENAI_MAX_CONCURRENCY, max_keepalive_connections=OPENAI_MAX_CONCURRENCY)),
+)
+completion_slots = asyncio.Semaphore(OPENAI_MAX_CONCURRENCY)
+runner = create_call_runner()
+query_cache = QueryCache(
+    max_entries=int(os.environ.get("QUERY_CACHE_SIZE", DEFAULT_CACHE_SIZE)),
+    ttl_seconds=float(os.environ.get("QUERY_CACHE_TTL_SECONDS", DEFAULT_CACHE_TTL_SECONDS)),
+    disk_path=os.environ.get("QUERY_CACHE_PATH") or None,
+    disk_max_entries=int(os.environ.get("QUERY_CACHE_DISK_SIZE", DEFAULT_DISK_CACHE_SIZE)),
+)
+retriever = create_retriever(cache=query_cache, runner=runner)
+query_cache.set_version(retriever.version)
+last_version_check = time.monotonic()
+
+async def refresh_retriever():
+    # Reload the indexes and drop cached results once a new pipeline output has been indexed.
+    global retriever, last_version_check
+    if time.monotonic() - last_version_check < INDEX_VERSION_CHECK_SECONDS:
+        return
+    last_version_check = time.monotonic()
+    if await retriever.current_version() != retriever.version:
+        retriever = await asyncio.to_thread(create_retriever, cache=query_cache, runner=runner)
+        query_cache.set_version(retriever.version)
+        logging.info(f"Index version changed to {retriever.version}; query cache invalidated.")
 
 async def similarity_search(query, top_k=10):
-    query_embedding = pc.inference.embed(
-        model="multilingual-e5-large",
-        inputs=[query],
-        parameters={"input_type": "query"}
-    )
-
-    if query_embedding and 'values' in query_embedding[0]:
-        results = index.query(
-            vector=query_embedding[0]['values'],
-            top_k=top_k,
-            include_metadata=True
-        )
-        return results['matches'] if results['matches'] else []
-    else:
-        return []
+    start = time.perf_counter()
+    await refresh_retriever()
+    (matches, path), source = await query_cache.get_or_compute(f"results:{top_k}", query, lambda: retriever.search(query, top_k))
+    logging.info(f"Retrieved {len(matches)} matches via the {path} path of the {retriever.name} backend ({source}) in {(time.perf_counter() - start) * 1000:.2f} ms")
+    logging.info(f"Query cache stats: {query_cache.stats}; remote call stats: {runner.stats}")
+    return matches
 
 async def retrieve_food_data(query):
     raw_retrieved_food_data = await similarity_search(query)
-    return get_food_nutrients(raw_retrieved_food_data)
+    return [doc['metadata'] for doc in raw_retrieved_food_data]
 
 async def stream_completion(message_history):
     msg = cl.Message(content="")
     await msg.send()
 
     try:
-        stream = await client.chat.completions.create(
-            messages=message_history,
-            stream=True,
-            model="gpt-4o",
-            temperature=0
-        )
-        
-        response_content = ""
-        async for part in stream:
-            token = part.choices[0].delta.content or ""
-            await msg.stream_token(token)
-            response_content += token
+        async with completion_slots:
+            stream = await client.chat.completions.create(
+                messages=message_history,
+                stream=True,
+                model="gpt-4o",
+                temperature=0,
+                stream_options={"include_usage": True}
+            )
+
+            response_content = ""
+            async for part in stream:
+                if part.usage:
+                    logging.info(f"Completion usage: {part.usage.prompt_tokens} prompt tokens, {part.usage.completion_tokens} completion tokens")
+                if not part.choices:
+                    continue
+                token = part.choices[0].delta.content or ""
+                await msg.stream_token(token)
+                response_content += token
         
         message_history.append({"role": "assistant", "content": response_content})
         await msg.send()
@@ -105,22 +95,31 @@ async def handle_conversation(user_query):
     food_data = cl.user_session.get("food_data")
 
     if food_data is None:
-        logging.info("Retrieving food data from Pinecone based on user query.")
-        food_data = await retrieve_food_data(user_query)
+        logging.info(f"Retrieving food data from the {retriever.name} backend based on user query.")
+        try:
+            food_data = await retrieve_food_data(user_query)
+        except (RemoteCallRejected, asyncio.TimeoutError) as e:
+            # Nothing is stored in the session, so the user's next message retries the retrieval.
+            logging.warning(f"Retrieval unavailable: {e!r}")
+            await cl.Message(content=BUSY_MESSAGE).send()
+            return
         cl.user_session.set("food_data", food_data)
-        
+
+        # The food context is encoded once per session into the first message and reused on every later turn.
+        prompt, encoded_foods = build_system_prompt(food_data, CONTEXT_TOKEN_BUDGET)
         if not food_data:
-            prompt = "I'm sorry, I don't have enough information to accurately answer that question."
             logging.info("No relevant food data found.")
         else:
-            prompt = generate_prompt(user_query, food_data)
-            logging.info(f"Generated prompt: {prompt}")
+            logging.info(f"Encoded {encoded_foods} of {len(food_data)} foods into a {count_tokens(prompt)}-token system prompt.")
+        message_history.insert(0, {"role": "system", "content": prompt})
     else:
         logging.info("Using previously retrieved food data for conversation.")
-        prompt = generate_prompt(user_query, food_data)
 
     message_history.append({"role": "user", "content": user_query})
-    message_history.append({"role": "system", "content": prompt})
+    prompt_tokens = cl.user_session.get("prompt_tokens", [])
+    prompt_tokens.append(count_message_tokens(message_history))
+    cl.user_session.set("prompt_tokens", prompt_tokens)
+    logging.info(f"Turn {len(prompt_tokens)}: {prompt_tokens[-1]} prompt tokens (per turn so far: {prompt_tokens})")
     cl.user_session.set("message_history", message_history)
     await stream_completion(message_history)
 
@@ -0,0 +1,175 @@
+import os
+import re
+import json
+import time
+import argparse
+from bisect import bisect_left
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.ipc as ipc
+import pyarrow.compute as pc
+from local_index import create_temp_index_directory, load_food_table, replace_index_directory
+from record_store import RecordStore, write_record_store
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+TOKEN_PATTERN = re.compile(r'[A-Z0-9]+')
+GTIN_PATTERN = re.compile(r'\d{8,14}')
+
+def normalize_name(text):
+    return ' '.join(str(text).upper().split())
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(str(text).upper())
+
+def normalize_gtin(text):
+    # UPC-A, EAN-13 and GTIN-14 spellings of the same code differ only in leading zeros.
+    digits = re.sub(r'[\s-]', '', str(text))
+    return int(digits) if GTIN_PATTERN.fullmatch(digits) and int(digits) > 0 else None
+
+def build_postings(names):
+    tokens = names.str.findall(TOKEN_PATTERN.pattern).explode().dropna()
+    term_ids, terms = pd.factorize(tokens, sort=True)
+    pairs = pd.DataFrame({'term': term_ids, 'row': tokens.index.to_numpy()})
+    counts = pairs.groupby(['term', 'row'], sort=True).size()
+
+    term_offsets = np.concatenate([[0], np.cumsum(np.bincount(counts.index.get_level_values('term'), minlength=len(terms)))])
+    doc_lengths = np.bincount(pairs['row'], minlength=len(names))
+    return (
+        {term: term_id for term_id, term in enumerate(terms)},
+        term_offsets.astype(np.int64),
+        counts.index.get_level_values('row').to_numpy().astype(np.int32),
+        np.minimum(counts.to_numpy(), np.iinfo(np.uint16).max).astype(np.uint16),
+        np.minimum(doc_lengths, np.iinfo(np.uint16).max).astype(np.uint16),
+    )
+
+def build_lexical_index(index_dir, food_table):
+    names = food_table['FOOD_NAME'].to_pandas().fillna('').map(normalize_name)
+    vocabulary, term_offsets, posting_rows, posting_counts, doc_lengths = build_postings(names)
+
+    gtins = food_table['FOOD_ID'].to_pandas().map(normalize_gtin).dropna().astype(np.int64)
+    gtins = gtins.sort_values(kind='stable')
+    names = pa.array(names, type=pa.string())
+    name_order = pc.sort_indices(names)
+
+    # Built beside the live index and swapped in, since a running LexicalIndex has these files memory-mapped.
+    temp_dir = create_temp_index_directory(index_dir)
+    np.save(os.path.join(temp_dir, 'term_offsets.npy'), term_offsets)
+    np.save(os.path.join(temp_dir, 'posting_rows.npy'), posting_rows)
+    np.save(os.path.join(temp_dir, 'posting_counts.npy'), posting_counts)
+    np.save(os.path.join(temp_dir, 'doc_lengths.npy'), doc_lengths)
+    np.save(os.path.join(temp_dir, 'gtin_keys.npy'), gtins.to_numpy())
+    np.save(os.path.join(temp_dir, 'gtin_rows.npy'), gtins.index.to_numpy().astype(np.int32))
+    write_record_store(os.path.join(temp_dir, 'names.arrow'), pa.table({
+        'NAME': names.take(name_order),
+        'ROW': name_order.cast(pa.int32()),
+    }))
+    write_record_store(os.path.join(temp_dir, 'records.arrow'), food_table)
+    with open(os.path.join(temp_dir, 'vocabulary.json'), 'w') as file:
+        json.dump(vocabulary, file)
+
+    info = {
+        'version': f"{int(time.time())}-{food_table.num_rows}",
+        'count': food_table.num_rows,
+        'terms': len(vocabulary),
+        'average_doc_length': float(doc_lengths.mean()) if len(doc_lengths) else 0.0,
+    }
+    with open(os.path.join(temp_dir, 'index.json'), 'w') as file:
+        json.dump(info, file, indent=2)
+    replace_index_directory(temp_dir, index_dir)
+    return info
+
+class SortedNames:
+    # Sequence view over the memory-mapped name column so bisect can binary search it without materializing it.
+    def __init__(self, column):
+        self.column = column
+
+    def __len__(self):
+        return len(self.column)
+
+    def __getitem__(self, position):
+        return self.column[position].as_py()
+
+class LexicalIndex:
+    def __init__(self, index_dir):
+        self.index_dir = index_dir
+        with open(os.path.join(index_dir, 'index.json')) as file:
+            self.info = json.load(file)
+        with open(os.path.join(index_dir, 'vocabulary.json')) as file:
+            self.vocabulary = json.load(file)
+        self.version = self.info['version']
+        self.term_offsets = np.load(os.path.join(index_dir, 'term_offsets.npy'))
+        self.posting_rows = np.load(os.path.join(index_dir, 'posting_rows.npy'), mmap_mode='r')
+        self.posting_counts = np.load(os.path.join(index_dir, 'posting_counts.npy'), mmap_mode='r')
+        self.doc_lengths = np.load(os.path.join(index_dir, 'doc_lengths.npy'), mmap_mode='r')
+        self.gtin_keys = np.load(os.path.join(index_dir, 'gtin_keys.npy'), mmap_mode='r')
+        self.gtin_rows = np.load(os.path.join(index_dir, 'gtin_rows.npy'), mmap_mode='r')
+        names = ipc.open_file(pa.memory_map(os.path.join(index_dir, 'names.arrow'), 'r')).read_all().combine_chunks()
+        self.names = SortedNames(names['NAME'])
+        self.name_rows = names['ROW']
+        self.records = RecordStore(os.path.join(index_dir, 'records.arrow'))
+
+    def lookup_gtin(self, query, limit=10):
+        gtin = normalize_gtin(query)
+        if gtin is None:
+            return []
+        start = np.searchsorted(self.gtin_keys, gtin, side='left')
+        end = np.searchsorted(self.gtin_keys, gtin, side='right')
+        rows = self.gtin_rows[start:min(end, start + limit)]
+        return self.records.get_matches(rows, np.ones(len(rows)))
+
+    def lookup_name(self, query, limit=10):
+        # Exact name matches when there are any, otherwise names starting with the query; returns (matches, 'exact'|'prefix').
+        name = normalize_name(query)
+        if not name:
+            return [], None
+        start = bisect_left(self.names, name)
+        exact_end = start
+        while exact_end < len(self.names) and exact_end - start < limit and self.names[exact_end] == name:
+            exact_end += 1
+        if exact_end > start:
+            rows = self.name_rows[start:exact_end].to_numpy()
+            return self.records.get_matches(rows, np.ones(len(rows))), 'exact'
+
+        # Only answer from the prefix range when it is specific enough to fit in the result list.
+        prefix_end = bisect_left(self.names, name + '\U0010ffff', start, min(start + limit + 1, len(self.names)))
+        if start == prefix_end or prefix_end - start > limit:
+            return [], None
+        rows = self.name_rows[start:prefix_end].to_numpy()
+        return self.records.get_matches(rows, np.ones(len(rows))), 'prefix'
+
+    def bm25(self, query, limit=10):
+        term_ids = {self.vocabulary[token] for token in tokenize(query) if token in self.vocabulary}
+        if not term_ids:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        rows, scores = [], []
+        average_doc_length = self.info['average_doc_length']
+        for term_id in term_ids:
+            start, end = self.term_offsets[term_id], self.term_offsets[term_id + 1]
+            term_rows = np.asarray(self.posting_rows[start:end])
+            counts = np.asarray(self.posting_counts[start:end], dtype=np.float32)
+            idf = np.log1p((self.info['count'] - (end - start) + 0.5) / (end - start + 0.5))
+            lengths = np.asarray(self.doc_lengths[term_rows], dtype=np.float32)
+            rows.append(term_rows)
+            scores.append(idf * counts * (BM25_K1 + 1) / (counts + BM25_K1 * (1 - BM25_B + BM25_B * lengths / average_doc_length)))
+
+        rows, inverse = np.unique(np.concatenate(rows), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(scores)).astype(np.float32)
+        best = np.argpartition(-scores, min(limit, len(scores)) - 1)[:limit]
+        best = best[np.argsort(-scores[best], kind='stable')]
+        return rows[best], scores[best]
+
+    def search(self, query, limit=10):
+        rows, scores = self.bm25(query, limit)
+        return self.records.get_matches(rows, scores)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the FOOD_NAME inverted index and FOOD_ID lookup used for lexical and exact-match retrieval.")
+    parser.add_argument("--data", default="../usda_branded_food_data_parquet", help="Pipeline output: the Parquet dataset directory or the CSV.")
+    parser.add_argument("--output", default="usda_food_lexical_index")
+    args = parser.parse_args()
+
+    info = build_lexical_index(args.output, load_food_table(args.data))
+    print(f"Indexed {info['count']} records and {info['terms']} terms at {args.output} (version {info['version']}).")
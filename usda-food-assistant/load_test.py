@@ -0,0 +1,129 @@
+import time
+import asyncio
+import argparse
+import numpy as np
+from types import SimpleNamespace
+from retrieval import PineconeRetriever
+from prompt_builder import build_system_prompt
+from remote_calls import BlockingCallRunner
+
+STUB_DIMENSION = 1024
+
+class StubInference:
+    def __init__(self, latency_seconds):
+        self.latency_seconds = latency_seconds
+
+    def embed(self, model, inputs, parameters):
+        time.sleep(self.latency_seconds)
+        return [{'values': [0.0] * STUB_DIMENSION} for _ in inputs]
+
+class StubPineconeIndex:
+    def __init__(self, latency_seconds):
+        self.latency_seconds = latency_seconds
+
+    def fetch(self, ids, namespace, timeout=None):
+        return SimpleNamespace(vectors={})
+
+    def describe_index_stats(self, timeout=None):
+        return {'total_vector_count': 0}
+
+    def query(self, vector, top_k, include_metadata, timeout=None):
+        time.sleep(self.latency_seconds)
+        matches = [
+            {'id': str(i), 'score': 1.0 - i / 100, 'metadata': {'FOOD_NAME': f"STUB FOOD {i}", 'FOOD_SERVING_SIZE': '30 G', 'PROTEIN (G)': float(i)}}
+            for i in range(top_k)
+        ]
+        return {'matches': matches}
+
+class StubPinecone:
+    # Blocking client with the same call shapes as PineconeGRPC, so the real PineconeRetriever code path is exercised.
+    def __init__(self, embed_latency_seconds, query_latency_seconds):
+        self.inference = StubInference(embed_latency_seconds)
+        self.query_latency_seconds = query_latency_seconds
+
+    def Index(self, name):
+        return StubPineconeIndex(self.query_latency_seconds)
+
+class StubChatCompletions:
+    def __init__(self, first_token_seconds, token_interval_seconds, tokens):
+        self.first_token_seconds = first_token_seconds
+        self.token_interval_seconds = token_interval_seconds
+        self.tokens = tokens
+
+    async def create(self, messages, **kwargs):
+        async def stream():
+            await asyncio.sleep(self.first_token_seconds)
+            for i in range(self.tokens):
+                if i:
+                    await asyncio.sleep(self.token_interval_seconds)
+                yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content="token "))], usage=None)
+        return stream()
+
+class InlineCallRunner:
+    # Calls the blocking client directly on the event loop, as the assistant did before BlockingCallRunner.
+    stats = {}
+    timeout_seconds = None
+
+    async def run(self, function, *args, timeout_seconds=None, **kwargs):
+        return function(*args, **kwargs)
+
+async def run_session(session_id, arrival, retriever, completions, completion_slots, results):
+    # TTFT is measured from the scheduled arrival, so time spent waiting for a stalled event loop counts too.
+    matches, _ = await retriever.search(f"stub food query {session_id}", 10)
+    prompt, _ = build_system_prompt([match['metadata'] for match in matches])
+    messages = [{"role": "system", "content": prompt}, {"role": "user", "content": f"stub food query {session_id}"}]
+
+    async with completion_slots:
+        stream = await completions.create(messages=messages, stream=True)
+        first_token, last_token, longest_gap = None, None, 0.0
+        async for part in stream:
+            now = time.perf_counter()
+            if first_token is None:
+                first_token = now
+            else:
+                longest_gap = max(longest_gap, now - last_token)
+            last_token = now
+    results.append((first_token - arrival, longest_gap))
+
+async def run_load_test(args, blocking):
+    client = StubPinecone(args.embed_latency_ms / 1000, args.query_latency_ms / 1000)
+    runner = InlineCallRunner() if blocking else BlockingCallRunner(args.workers, args.max_pending, args.timeout_seconds)
+    retriever = PineconeRetriever(client=client, runner=runner)
+    completions = StubChatCompletions(args.first_token_ms / 1000, args.token_interval_ms / 1000, args.tokens)
+    completion_slots = asyncio.Semaphore(args.completion_concurrency)
+
+    results, sessions = [], []
+    ramp_start = time.perf_counter()
+    for session_id in range(args.sessions):
+        arrival = ramp_start + session_id * args.ramp_seconds / args.sessions
+        await asyncio.sleep(max(0.0, arrival - time.perf_counter()))
+        sessions.append(asyncio.create_task(run_session(session_id, arrival, retriever, completions, completion_slots, results)))
+    outcomes = await asyncio.gather(*sessions, return_exceptions=True)
+    failures = sum(isinstance(outcome, Exception) for outcome in outcomes)
+
+    ttft = np.array([first for first, _ in results]) * 1000
+    gaps = np.array([gap for _, gap in results]) * 1000
+    mode = "blocking" if blocking else "executor"
+    print(f"{mode:>9}  sessions {len(results):>5}  failed {failures:>4}  "
+          f"TTFT p50 {np.percentile(ttft, 50):8.1f} ms  p99 {np.percentile(ttft, 99):8.1f} ms  "
+          f"token gap p99 {np.percentile(gaps, 99):7.1f} ms  {runner.stats}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulate concurrent chat sessions against stub Pinecone and OpenAI clients and report time-to-first-token.")
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--ramp-seconds", type=float, default=2.0, help="Sessions start evenly spread over this window.")
+    parser.add_argument("--embed-latency-ms", type=float, default=40)
+    parser.add_argument("--query-latency-ms", type=float, default=30)
+    parser.add_argument("--first-token-ms", type=float, default=300)
+    parser.add_argument("--token-interval-ms", type=float, default=20)
+    parser.add_argument("--tokens", type=int, default=50)
+    parser.add_argument("--workers", type=int, default=16, help="Blocking call workers (REMOTE_CALL_WORKERS).")
+    parser.add_argument("--max-pending", type=int, default=1000, help="Queued calls before new ones are rejected (REMOTE_CALL_MAX_PENDING).")
+    parser.add_argument("--timeout-seconds", type=float, default=30)
+    parser.add_argument("--completion-concurrency", type=int, default=256, help="Concurrent completions (OPENAI_MAX_CONCURRENCY).")
+    parser.add_argument("--compare", action="store_true", help="Also run with blocking calls on the event loop, as before.")
+    args = parser.parse_args()
+
+    if args.compare:
+        asyncio.run(run_load_test(args, blocking=True))
+    asyncio.run(run_load_test(args, blocking=False))
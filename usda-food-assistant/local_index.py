@@ -0,0 +1,188 @@
+import os
+import json
+import shutil
+import time
+import argparse
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+from record_store import RecordStore, write_record_store
+
+EMBEDDING_MODEL = "intfloat/multilingual-e5-large"
+DEFAULT_NPROBE = 16
+KMEANS_ITERATIONS = 10
+KMEANS_SAMPLE_SIZE = 100_000
+SCORE_BATCH_SIZE = 16_384
+
+def normalize_rows(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return (vectors / np.maximum(norms, 1e-12)).astype(np.float32)
+
+def assign_to_centroids(vectors, centroids):
+    assignments = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), SCORE_BATCH_SIZE):
+        batch = np.asarray(vectors[start:start + SCORE_BATCH_SIZE], dtype=np.float32)
+        assignments[start:start + len(batch)] = np.argmax(batch @ centroids.T, axis=1)
+    return assignments
+
+def train_centroids(vectors, nlist, seed=0):
+    rng = np.random.default_rng(seed)
+    sample = vectors[np.sort(rng.choice(len(vectors), min(len(vectors), KMEANS_SAMPLE_SIZE), replace=False))]
+    centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+
+    for _ in range(KMEANS_ITERATIONS):
+        assignments = assign_to_centroids(sample, centroids)
+        order = np.argsort(assignments, kind='stable')
+        sorted_assignments = assignments[order]
+        starts = np.flatnonzero(np.r_[True, sorted_assignments[1:] != sorted_assignments[:-1]])
+        # Spherical k-means: the normalized sum is the cosine centroid; empty lists keep their previous centroid.
+        centroids[sorted_assignments[starts]] = normalize_rows(np.add.reduceat(sample[order], starts, axis=0))
+    return centroids
+
+def quantize_int8(vectors):
+    scales = np.maximum(np.abs(vectors).max(axis=1), 1e-12) / 127
+    return np.round(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+
+def load_food_table(data_path):
+    if os.path.isdir(data_path):
+        return ds.dataset(data_path, format='parquet').to_table()
+    return pa.Table.from_pandas(pd.read_csv(data_path, low_memory=False, dtype={'FOOD_RECORD_ID': str, 'FOOD_ID': str}), preserve_index=False)
+
+def create_temp_index_directory(index_dir):
+    temp_dir = f"{index_dir}.tmp"
+    shutil.rmtree(temp_dir, ignore_errors=True)
+    os.makedirs(temp_dir)
+    return temp_dir
+
+def replace_index_directory(temp_dir, index_dir):
+    # A running assistant has the index files memory-mapped, and rewriting them in place kills it with SIGBUS. So
+    # rebuilds go to temp_dir and are swapped in by rename; open handles keep the unlinked old files until they reload.
+    old_dir = f"{index_dir}.old"
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if os.path.exists(index_dir):
+        os.replace(index_dir, old_dir)
+    os.replace(temp_dir, index_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+def build_index(index_dir, food_table, ids, vectors, nlist=None, dtype='float32', embedding_model=EMBEDDING_MODEL):
+    positions = pd.Index(food_table['FOOD_RECORD_ID'].to_pandas()).get_indexer(pd.Index(ids).astype(str))
+    found = positions >= 0
+    vectors = normalize_rows(np.asarray(vectors, dtype=np.float32)[found])
+    food_table = food_table.take(positions[found])
+
+    nlist = min(nlist or max(1, int(4 * np.sqrt(len(vectors)))), len(vectors), KMEANS_SAMPLE_SIZE)
+    centroids = train_centroids(vectors, nlist)
+    assignments = assign_to_centroids(vectors, centroids)
+    order = np.argsort(assignments, kind='stable')
+    list_offsets = np.concatenate([[0], np.cumsum(np.bincount(assignments, minlength=nlist))]).astype(np.int64)
+
+    temp_dir = create_temp_index_directory(index_dir)
+    vectors = vectors[order]
+    if dtype == 'int8':
+        vectors, scales = quantize_int8(vectors)
+        np.save(os.path.join(temp_dir, 'scales.npy'), scales)
+    np.save(os.path.join(temp_dir, 'vectors.npy'), vectors)
+    np.save(os.path.join(temp_dir, 'centroids.npy'), centroids)
+    np.save(os.path.join(temp_dir, 'list_offsets.npy'), list_offsets)
+    write_record_store(os.path.join(temp_dir, 'metadata.arrow'), food_table.take(order))
+
+    info = {
+        'version': f"{int(time.time())}-{len(vectors)}",
+        'count': len(vectors),
+        'dimension': vectors.shape[1],
+        'nlist': nlist,
+        'dtype': dtype,
+        'metric': 'cosine',
+        # Queries must be embedded with the model that produced the passage vectors.
+        'embedding_model': embedding_model,
+    }
+    # Written last, so a directory with an index.json is always complete.
+    with open(os.path.join(temp_dir, 'index.json'), 'w') as file:
+        json.dump(info, file, indent=2)
+    replace_index_directory(temp_dir, index_dir)
+    return info
+
+def read_index_version(index_dir):
+    with open(os.path.join(index_dir, 'index.json')) as file:
+        return json.load(file)['version']
+
+class LocalVectorIndex:
+    def __init__(self, index_dir, nprobe=DEFAULT_NPROBE):
+        with open(os.path.join(index_dir, 'index.json')) as file:
+            self.info = json.load(file)
+        self.info.setdefault('embedding_model', EMBEDDING_MODEL)
+        self.version = self.info['version']
+        self.nprobe = nprobe
+        self.centroids = np.load(os.path.join(index_dir, 'centroids.npy'))
+        self.list_offsets = np.load(os.path.join(index_dir, 'list_offsets.npy'))
+        self.vectors = np.load(os.path.join(index_dir, 'vectors.npy'), mmap_mode='r')
+        self.scales = np.load(os.path.join(index_dir, 'scales.npy'), mmap_mode='r') if self.info['dtype'] == 'int8' else None
+        self.metadata = RecordStore(os.path.join(index_dir, 'metadata.arrow'))
+
+    def check_embedder(self, embedder):
+        if embedder.dimension != self.info['dimension']:
+            raise ValueError(f"{embedder.model_name} produces {embedder.dimension}-dimensional vectors, but the index was built "
+                             f"from {self.info['dimension']}-dimensional {self.info['embedding_model']} vectors.")
+
+    def search(self, query_vector, top_k=10):
+        query_vector = normalize_rows(np.asarray(query_vector, dtype=np.float32)[None, :])[0]
+        centroid_scores = self.centroids @ query_vector
+        nprobe = min(self.nprobe, len(centroid_scores))
+        probed_lists = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+
+        rows, scores = [], []
+        for list_id in probed_lists:
+            start, end = self.list_offsets[list_id], self.list_offsets[list_id + 1]
+            if start == end:
+                continue
+            list_scores = np.asarray(self.vectors[start:end], dtype=np.float32) @ query_vector
+            if self.scales is not None:
+                list_scores *= self.scales[start:end]
+            rows.append(np.arange(start, end))
+            scores.append(list_scores)
+        if not rows:
+            return []
+
+        rows, scores = np.concatenate(rows), np.concatenate(scores)
+        best = np.argpartition(-scores, min(top_k, len(scores)) - 1)[:top_k]
+        best = best[np.argsort(-scores[best], kind='stable')]
+        return self.metadata.get_matches(rows[best], scores[best])
+
+class LocalEmbedder:
+    # model_name is a Hugging Face model name or a local model directory. A name is downloaded into the Hugging Face
+    # cache on first use, so for offline use pre-fetch it (and set HF_HUB_OFFLINE=1) or pass the directory instead.
+    def __init__(self, model_name=EMBEDDING_MODEL):
+        from sentence_transformers import SentenceTransformer
+        self.model_name = model_name
+        self.model = SentenceTransformer(model_name)
+        self.dimension = self.model.get_sentence_embedding_dimension()
+
+    def embed_queries(self, texts):
+        return self.model.encode([f"query: {text}" for text in texts], normalize_embeddings=True)
+
+    def embed_passages(self, texts, batch_size=64):
+        return self.model.encode([f"passage: {text}" for text in texts], batch_size=batch_size, normalize_embeddings=True)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the on-disk IVF index used by RETRIEVAL_BACKEND=local.")
+    parser.add_argument("--data", default="../usda_branded_food_data_parquet", help="Pipeline output: the Parquet dataset directory or the CSV.")
+    parser.add_argument("--embeddings", default=None,
+                        help="Precomputed passage embeddings (.npz with 'ids' and 'vectors'). Computed locally with --embedding-model when omitted.")
+    parser.add_argument("--embedding-model", default=EMBEDDING_MODEL,
+                        help="Hugging Face model name or local model directory that produced --embeddings; recorded in index.json and used to embed queries.")
+    parser.add_argument("--output", default="usda_food_index")
+    parser.add_argument("--nlist", type=int, default=None, help="Number of IVF lists (default 4 * sqrt(records)).")
+    parser.add_argument("--dtype", choices=['float32', 'int8'], default='float32')
+    args = parser.parse_args()
+
+    food_table = load_food_table(args.data)
+    if args.embeddings:
+        with np.load(args.embeddings) as embeddings:
+            ids, vectors = embeddings['ids'], embeddings['vectors']
+    else:
+        ids = food_table['FOOD_RECORD_ID'].to_numpy(zero_copy_only=False)
+        vectors = LocalEmbedder(args.embedding_model).embed_passages(food_table['FOOD_NAME'].to_pylist())
+
+    info = build_index(args.output, food_table, ids, vectors, args.nlist, args.dtype, args.embedding_model)
+    print(f"Indexed {info['count']} records into {info['nlist']} lists at {args.output} (version {info['version']}).")
@@ -0,0 +1,80 @@
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+DEFAULT_CONTEXT_TOKEN_BUDGET = 6000
+TOKENS_PER_MESSAGE = 4
+CHARACTERS_PER_TOKEN = 4
+NO_DATA_PROMPT = "I'm sorry, I don't have enough information to accurately answer that question."
+
+SYSTEM_PROMPT_TEMPLATE = """Answer the user's queries using the food data information provided. Not all data will be required to properly answer the user's query. Only use the data for the food which they are asking about. Don't interpolate information.
+For example, if the user asks about potential allergens, answer analytically, using the information available to you to cite the source. You have data from the USDA FoodData Central Dataset loaded into your context, which is food data directly from food labels, which ensures accuracy. Therefore, there is no need to advise the user to "always check the back of the packaging for the most up-to-date information," as the data provided comes from reliable sources, including public and private USDA data gathering methods.
+
+Nutrient values are provided as concentrations per 100 grams of the edible portion of the food. If a nutrient value is listed as 0.0, it indicates that the nutrient is present in such a small quantity that it falls below the detectable limit (Limit of Quantification (LOQ)). DO NOT use square brackets in your LaTeX equations.
+
+Serving size information is available, but nutrient data is consistently expressed per 100 grams/milliliters. If the user asks for serving size data, provide the available information, but clarify that the nutrient values themselves are not based on the serving size.
+
+The user may input their question about a very specific branded food item, or a more general food item, such as an ingredient. In the case where they ask about a specific branded food item by name, use only the data associated with that food item. In the case where the user asks about a general food, you'll have data for multiple brands of that food produce available in your context, therefore choose the most general version of that product in that case or average over the nutrient data to provide the average general food ingredient in that case.
+
+If the context provided isn't enough to accurately answer the question, reply with "I'm sorry, I don't have enough information to accurately answer that question."
+For example, if a user asks about "Original Oreos", but the data which gets retrieved is for "Original Cookies" in that case, mention that you don't have enough information
+to accurately answer the questions about Original Oreos. Would you like me to provide general nutritional information for Original Cookies instead?". But obviously adapt
+that to the food the user has actually entered.
+
+Make sure to start the response by mentioning the item you are referring to.
+
+The food data is a table with one row per retrieved food, ranked by relevance. Empty cells mean the value is not available for that food. Values shared by every food are listed once above the table.
+
+Food Data:
+{food_table}
+
+Important: The first message the user will provide is just the food item. You should respond with something like "Loaded ingredient and nutrient data for [FOOD_NAME]. Heres's some basic information: [Give some basic information about the food]. For more detailed information, please begin asking your questions. And then list out some example questions in italics such as "Does this food contain any allergens?, "Give me a detailed nutrient breakdown, including micronutrients such as vitamins and minerals.", "I have 250 grams of this food, how many calories is that, and how many grams of sugar in that amount?"
+Additionally, when appropriate, make good use of markdown formatting, such as tables, headings, bolding and italics when presenting the information to the user to make the experience visually appealing. Very important, if displaying in-line equations wrap the equations in single dollar signs $ In-line LaTex Equation Here $, and for larger, more visual equations, use double dollar signs $$ Larger more visual Multi-Line LaTeX Equation Here $$. DO NOT use square brackets in your LaTeX equations.
+"""
+
+if tiktoken is not None:
+    encoding = tiktoken.encoding_for_model("gpt-4o")
+
+    def count_tokens(text):
+        return len(encoding.encode(text))
+else:
+    def count_tokens(text):
+        # Rough estimate for English text when tiktoken is not installed.
+        return (len(text) + CHARACTERS_PER_TOKEN - 1) // CHARACTERS_PER_TOKEN
+
+def count_message_tokens(messages):
+    return sum(count_tokens(message['content']) + TOKENS_PER_MESSAGE for message in messages)
+
+def format_value(value):
+    return str(value).replace('|', '/').replace('\n', ' ')
+
+def encode_food_table(foods):
+    # Columns missing from every food are dropped, and columns with one value across all foods are hoisted
+    # above the table instead of being repeated on every row.
+    columns = list(dict.fromkeys(column for food in foods for column in food))
+    shared = [column for column in columns if len(foods) > 1 and all(column in food for food in foods)
+              and len({format_value(food[column]) for food in foods}) == 1]
+    columns = [column for column in columns if column not in shared]
+
+    lines = [f"{column}: {format_value(foods[0][column])}" for column in shared]
+    lines.append("| " + " | ".join(columns) + " |")
+    lines += ["| " + " | ".join(format_value(food[column]) if column in food else "" for column in columns) + " |" for food in foods]
+    return "\n".join(lines)
+
+def build_food_context(foods, token_budget=DEFAULT_CONTEXT_TOKEN_BUDGET):
+    # Keeps the highest-ranked foods whose table fits the budget; the top match is always kept.
+    # Returns the table and how many foods it holds.
+    kept = len(foods)
+    table = encode_food_table(foods)
+    while kept > 1 and count_tokens(table) > token_budget:
+        # Drop roughly the share of rows that overflows, then re-encode since shared and empty columns can change.
+        kept = max(1, min(kept - 1, int(kept * token_budget / count_tokens(table))))
+        table = encode_food_table(foods[:kept])
+    return table, kept
+
+def build_system_prompt(foods, token_budget=DEFAULT_CONTEXT_TOKEN_BUDGET):
+    if not foods:
+        return NO_DATA_PROMPT, 0
+    food_table, kept = build_food_context(foods, token_budget)
+    return SYSTEM_PROMPT_TEMPLATE.format(food_table=food_table), kept
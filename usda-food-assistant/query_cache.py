@@ -0,0 +1,160 @@
+import json
+import time
+import asyncio
+import logging
+import sqlite3
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_CACHE_SIZE = 1024
+DEFAULT_CACHE_TTL_SECONDS = 3600
+# An embedding row is about 20 KB, so the default caps the file at roughly 200 MB.
+DEFAULT_DISK_CACHE_SIZE = 10_000
+DISK_PRUNE_INTERVAL = 64
+
+def normalize_query(query):
+    return ' '.join(query.lower().split())
+
+class DiskCacheTier:
+    # SQLite file holding JSON values so cached embeddings and results survive restarts. Every statement runs on one
+    # dedicated thread, so lookups and commits never block the event loop and SQLite sees a single writer.
+    # Expired rows are purged, and the rows nearest expiry evicted beyond max_entries, every DISK_PRUNE_INTERVAL writes.
+    def __init__(self, path, max_entries=DEFAULT_DISK_CACHE_SIZE):
+        self.executor = ThreadPoolExecutor(1, thread_name_prefix="query-cache")
+        self.max_entries = max_entries
+        self.writes = 0
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT, expires_at REAL)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS cache_expires_at ON cache (expires_at)")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS info (name TEXT PRIMARY KEY, value TEXT)")
+        self.prune()
+        self.connection.commit()
+
+    def prune(self):
+        self.connection.execute("DELETE FROM cache WHERE expires_at <= ?", (time.time(),))
+        # Every row gets the same TTL, so the earliest expiry is also the oldest write.
+        self.connection.execute("DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+                                (self.max_entries,))
+
+    def read(self, key, now):
+        row = self.connection.execute("SELECT value, expires_at FROM cache WHERE key = ?", (key,)).fetchone()
+        if row is None or row[1] <= now:
+            return None
+        return row[1], json.loads(row[0])
+
+    def write(self, key, value, expires_at):
+        self.connection.execute("INSERT OR REPLACE INTO cache VALUES (?, ?, ?)", (key, json.dumps(value), expires_at))
+        self.writes += 1
+        if self.writes % DISK_PRUNE_INTERVAL == 0:
+            self.prune()
+        self.connection.commit()
+
+    def reset_if_changed(self, version):
+        row = self.connection.execute("SELECT value FROM info WHERE name = 'version'").fetchone()
+        if row is not None and row[0] == version:
+            return
+        self.connection.execute("DELETE FROM cache")
+        self.connection.execute("INSERT OR REPLACE INTO info VALUES ('version', ?)", (version,))
+        self.connection.commit()
+
+    def submit(self, function, *args):
+        # Writes are not awaited; the single thread still applies them in order, before any later lookup.
+        future = self.executor.submit(function, *args)
+        future.add_done_callback(lambda done: done.exception() and logging.warning(f"Query cache disk write failed: {done.exception()!r}"))
+
+    async def get(self, key):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, self.read, key, time.time())
+
+    def set(self, key, value, expires_at):
+        self.submit(self.write, key, value, expires_at)
+
+    def set_version(self, version):
+        self.submit(self.reset_if_changed, version)
+
+class QueryCache:
+    # LRU + TTL cache for query embeddings and retrieval results, with an optional disk tier.
+    # Concurrent misses on the same key share one computation, and everything is dropped when the index version changes.
+    def __init__(self, max_entries=DEFAULT_CACHE_SIZE, ttl_seconds=DEFAULT_CACHE_TTL_SECONDS, disk_path=None, version=None,
+                 disk_max_entries=DEFAULT_DISK_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.entries = OrderedDict()
+        self.in_flight = {}
+        self.stats = {'hits': 0, 'disk_hits': 0, 'misses': 0, 'shared': 0, 'evictions': 0, 'expirations': 0, 'invalidations': 0}
+        self.disk = DiskCacheTier(disk_path, disk_max_entries) if disk_path else None
+        self.version = None
+        if version is not None:
+            self.set_version(version)
+
+    def set_version(self, version):
+        version = str(version)
+        if version == self.version:
+            return
+        if self.version is not None:
+            self.stats['invalidations'] += 1
+        self.entries.clear()
+        self.in_flight.clear()
+        if self.disk:
+            self.disk.set_version(version)
+        self.version = version
+
+    def get(self, key):
+        # Returns (source, value) where source is 'memory', or None on a miss.
+        now = time.monotonic()
+        entry = self.entries.get(key)
+        if entry is not None:
+            if entry[0] > now:
+                self.entries.move_to_end(key)
+                self.stats['hits'] += 1
+                return 'memory', entry[1]
+            del self.entries[key]
+            self.stats['expirations'] += 1
+        return None, None
+
+    async def get_from_disk(self, key):
+        version = self.version
+        stored = await self.disk.get(key)
+        if stored is None or version != self.version:
+            return None, None
+        # The disk tier stores wall-clock expiry times, the memory tier monotonic ones.
+        self.stats['disk_hits'] += 1
+        self.put(key, stored[1], stored[0] - time.time() + time.monotonic(), persist=False)
+        return 'disk', stored[1]
+
+    def put(self, key, value, expires_at=None, persist=True):
+        expires_at = expires_at if expires_at is not None else time.monotonic() + self.ttl_seconds
+        self.entries[key] = (expires_at, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.stats['evictions'] += 1
+        if persist and self.disk:
+            self.disk.set(key, value, time.time() + self.ttl_seconds)
+
+    async def get_or_compute(self, namespace, query, compute):
+        # Returns (value, source) where source is 'memory', 'disk', 'computed' or 'shared' (joined an in-flight computation).
+        key = f"{namespace}:{normalize_query(query)}"
+        source, value = self.get(key)
+        if source is None and self.disk and key not in self.in_flight:
+            source, value = await self.get_from_disk(key)
+        if source:
+            return value, source
+
+        task = self.in_flight.get(key)
+        if task is None:
+            self.stats['misses'] += 1
+            task = asyncio.ensure_future(compute())
+            self.in_flight[key] = task
+            version = self.version
+            try:
+                value = await asyncio.shield(task)
+            finally:
+                if self.in_flight.get(key) is task:
+                    del self.in_flight[key]
+            if version == self.version:
+                self.put(key, value)
+            return value, 'computed'
+        # Another request is already computing this key; wait for its result instead of repeating the call.
+        self.stats['shared'] += 1
+        return await asyncio.shield(task), 'shared'
+
@@ -0,0 +1,25 @@
+import pyarrow as pa
+import pyarrow.ipc as ipc
+
+def write_record_store(path, table):
+    # Uncompressed Arrow IPC so the store can be memory-mapped and rows fetched without decoding whole columns.
+    with pa.OSFile(path, 'wb') as sink, ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table.combine_chunks())
+
+def clean_metadata(record):
+    # Nutrients come from the Parquet dataset, as float32 only where rounding to 2 decimals restores the CSV values.
+    return {key: round(value, 2) if isinstance(value, float) else value for key, value in record.items() if value is not None}
+
+class RecordStore:
+    def __init__(self, path):
+        self.table = ipc.open_file(pa.memory_map(path, 'r')).read_all()
+
+    def __len__(self):
+        return self.table.num_rows
+
+    def get_matches(self, rows, scores):
+        records = self.table.take(pa.array(rows, type=pa.int64())).to_pylist()
+        return [
+            {'id': record['FOOD_RECORD_ID'], 'score': float(score), 'metadata': clean_metadata(record)}
+            for record, score in zip(records, scores)
+        ]
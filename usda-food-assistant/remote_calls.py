@@ -0,0 +1,67 @@
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+DEFAULT_MAX_WORKERS = 16
+DEFAULT_MAX_PENDING = 64
+DEFAULT_TIMEOUT_SECONDS = 10.0
+
+class RemoteCallRejected(RuntimeError):
+    pass
+
+class BlockingCallRunner:
+    # Runs blocking client calls (Pinecone gRPC, local embedding and index search) on a bounded thread pool,
+    # so they never stall the event loop that streams tokens to every other session. At most max_workers calls
+    # run at once, up to max_pending more wait their turn, and anything beyond that is rejected immediately.
+    # A call keeps its slot until its thread actually returns, even after the caller has timed out, so hung
+    # calls keep counting against the limits instead of letting new work pile up behind them.
+    def __init__(self, max_workers=DEFAULT_MAX_WORKERS, max_pending=DEFAULT_MAX_PENDING, timeout_seconds=DEFAULT_TIMEOUT_SECONDS):
+        self.executor = ThreadPoolExecutor(max_workers, thread_name_prefix="remote-call")
+        self.slots = asyncio.Semaphore(max_workers)
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.timeout_seconds = timeout_seconds
+        self.active = 0
+        self.stats = {'calls': 0, 'timeouts': 0, 'rejected': 0}
+
+    def release(self):
+        self.slots.release()
+        self.active -= 1
+
+    async def run(self, function, *args, timeout_seconds=None, **kwargs):
+        if self.active >= self.max_workers + self.max_pending:
+            self.stats['rejected'] += 1
+            raise RemoteCallRejected(f"{self.active} remote calls already in flight")
+
+        # The timeout covers waiting for a slot as well as the call itself.
+        deadline = time.monotonic() + (timeout_seconds or self.timeout_seconds)
+        self.active += 1
+        try:
+            await asyncio.wait_for(self.slots.acquire(), deadline - time.monotonic())
+        except asyncio.TimeoutError:
+            self.active -= 1
+            self.stats['timeouts'] += 1
+            raise
+        except BaseException:
+            self.active -= 1
+            raise
+
+        self.stats['calls'] += 1
+        loop = asyncio.get_running_loop()
+        try:
+            future = self.executor.submit(partial(function, *args, **kwargs))
+        except BaseException:
+            self.release()
+            raise
+        # The slot is handed back from the loop when the worker thread finishes, not when the caller stops waiting.
+        future.add_done_callback(lambda _: loop.call_soon_threadsafe(self.release) if not loop.is_closed() else None)
+        result = asyncio.wrap_future(future)
+        # Marks a late failure as retrieved, since nobody awaits a call that already timed out.
+        result.add_done_callback(lambda done: done.cancelled() or done.exception())
+        try:
+            return await asyncio.wait_for(asyncio.shield(result), deadline - time.monotonic())
+        except asyncio.TimeoutError:
+            # The worker thread cannot be interrupted; its result is discarded when it finishes.
+            self.stats['timeouts'] += 1
+            raise
@@ -0,0 +1,174 @@
+import os
+import asyncio
+from remote_calls import DEFAULT_MAX_PENDING, DEFAULT_MAX_WORKERS, DEFAULT_TIMEOUT_SECONDS, BlockingCallRunner
+
+PINECONE_INDEX_NAME = "branded-food-data"
+LOCAL_INDEX_DIR = "usda_food_index"
+LEXICAL_INDEX_DIR = "usda_food_lexical_index"
+HYBRID_VECTOR_WEIGHT = 0.6
+HYBRID_CANDIDATE_MULTIPLIER = 3
+# Written by utils/upload_data_to_pinecone.py after every upload; keep the two in sync.
+INDEX_VERSION_NAMESPACE = "__index_version__"
+INDEX_VERSION_ID = "index-version"
+
+async def embed_with_cache(cache, query, embed):
+    if cache is None:
+        return await embed(query)
+    query_vector, _ = await cache.get_or_compute("embedding", query, lambda: embed(query))
+    return query_vector
+
+class PineconeRetriever:
+    name = "pinecone"
+
+    def __init__(self, index_name=PINECONE_INDEX_NAME, cache=None, runner=None, client=None):
+        if client is None:
+            from pinecone.grpc import PineconeGRPC as Pinecone
+            client = Pinecone()
+        # One client and index handle per process, so every session reuses the same pooled gRPC channel.
+        self.pc = client
+        self.index = self.pc.Index(index_name)
+        self.index_name = index_name
+        self.cache = cache
+        self.runner = runner or BlockingCallRunner()
+        self.version = self.read_version()
+
+    def read_version(self):
+        # The uploader rewrites a version record after every upload, since in-place updates leave the vector count
+        # unchanged. The count remains the fallback for indexes uploaded before the record existed.
+        response = self.index.fetch(ids=[INDEX_VERSION_ID], namespace=INDEX_VERSION_NAMESPACE, timeout=self.runner.timeout_seconds)
+        record = response.vectors.get(INDEX_VERSION_ID)
+        if record is not None:
+            return f"{self.index_name}:{record.metadata['version']}"
+        return f"{self.index_name}:{self.index.describe_index_stats(timeout=self.runner.timeout_seconds)['total_vector_count']}"
+
+    async def current_version(self):
+        return await self.runner.run(self.read_version)
+
+    async def embed_query(self, query):
+        # Inference goes over REST and the SDK takes no per-call deadline, so a hung embed is bounded by the runner's
+        # slot accounting alone: it keeps its slot until it returns, and excess calls are rejected meanwhile.
+        query_embedding = await self.runner.run(
+            self.pc.inference.embed,
+            model="multilingual-e5-large",
+            inputs=[query],
+            parameters={"input_type": "query"}
+        )
+        if query_embedding and 'values' in query_embedding[0]:
+            return list(query_embedding[0]['values'])
+        return None
+
+    async def search(self, query, top_k=10):
+        query_vector = await embed_with_cache(self.cache, query, self.embed_query)
+        if query_vector is None:
+            return [], "vector"
+
+        # The gRPC deadline makes a hung query give up and free its runner slot instead of holding it indefinitely.
+        results = await self.runner.run(
+            self.index.query,
+            vector=query_vector,
+            top_k=top_k,
+            include_metadata=True,
+            timeout=self.runner.timeout_seconds
+        )
+        matches = [{'id': match['id'], 'score': match['score'], 'metadata': dict(match['metadata'])} for match in results['matches'] or []]
+        return matches, "vector"
+
+class LocalRetriever:
+    name = "local"
+
+    def __init__(self, index_dir, nprobe=None, embedder=None, cache=None, runner=None, embedding_model=None):
+        from local_index import DEFAULT_NPROBE, LocalEmbedder, LocalVectorIndex
+        self.index_dir = index_dir
+        self.index = LocalVectorIndex(index_dir, nprobe or DEFAULT_NPROBE)
+        # embedding_model overrides where the recorded model is loaded from, e.g. a local copy on an offline host.
+        self.embedder = embedder or LocalEmbedder(embedding_model or self.index.info['embedding_model'])
+        self.index.check_embedder(self.embedder)
+        self.version = self.index.version
+        self.cache = cache
+        self.runner = runner or BlockingCallRunner()
+
+    async def current_version(self):
+        from local_index import read_index_version
+        return read_index_version(self.index_dir)
+
+    def embed_query_blocking(self, query):
+        return [float(value) for value in self.embedder.embed_queries([query])[0]]
+
+    async def embed_query(self, query):
+        # Model inference and the IVF scan hold the CPU for milliseconds, so they run off the event loop too.
+        return await self.runner.run(self.embed_query_blocking, query)
+
+    async def search(self, query, top_k=10):
+        query_vector = await embed_with_cache(self.cache, query, self.embed_query)
+        return await self.runner.run(self.index.search, query_vector, top_k), "vector"
+
+def normalize_scores(scores):
+    high, low = max(scores.values(), default=0.0), min(scores.values(), default=0.0)
+    return {key: (score - low) / (high - low) if high > low else 1.0 for key, score in scores.items()}
+
+class HybridRetriever:
+    # Answers GTIN and exact or prefix name queries from the lexical index without embedding them,
+    # and fuses BM25 with the vector backend's scores for everything else.
+    def __init__(self, vector_retriever, lexical_index, vector_weight=HYBRID_VECTOR_WEIGHT, runner=None):
+        self.vector_retriever = vector_retriever
+        self.lexical_index = lexical_index
+        self.runner = runner or vector_retriever.runner
+        self.vector_weight = vector_weight
+        self.name = f"hybrid+{vector_retriever.name}"
+        self.version = f"{vector_retriever.version}|{lexical_index.version}"
+
+    async def current_version(self):
+        from local_index import read_index_version
+        return f"{await self.vector_retriever.current_version()}|{read_index_version(self.lexical_index.index_dir)}"
+
+    async def search(self, query, top_k=10):
+        matches = self.lexical_index.lookup_gtin(query, top_k)
+        if matches:
+            return matches, "gtin"
+        matches, path = self.lexical_index.lookup_name(query, top_k)
+        if matches:
+            return matches, path
+
+        candidates = top_k * HYBRID_CANDIDATE_MULTIPLIER
+        # BM25 over common terms touches long posting lists, so it runs alongside the vector search.
+        (lexical_matches, (vector_matches, _)) = await asyncio.gather(
+            self.runner.run(self.lexical_index.search, query, candidates),
+            self.vector_retriever.search(query, candidates),
+        )
+        if not lexical_matches:
+            return list(vector_matches)[:top_k], "vector"
+
+        records = {match['id']: match for match in lexical_matches}
+        records.update({match['id']: match for match in vector_matches})
+        vector_scores = normalize_scores({match['id']: match['score'] for match in vector_matches})
+        lexical_scores = normalize_scores({match['id']: match['score'] for match in lexical_matches})
+        fused = {
+            record_id: self.vector_weight * vector_scores.get(record_id, 0.0) + (1 - self.vector_weight) * lexical_scores.get(record_id, 0.0)
+            for record_id in records
+        }
+        ranked = sorted(fused, key=fused.get, reverse=True)[:top_k]
+        return [{'id': record_id, 'score': fused[record_id], 'metadata': records[record_id]['metadata']} for record_id in ranked], "hybrid"
+
+def create_call_runner():
+    return BlockingCallRunner(
+        max_workers=int(os.environ.get("REMOTE_CALL_WORKERS", DEFAULT_MAX_WORKERS)),
+        max_pending=int(os.environ.get("REMOTE_CALL_MAX_PENDING", DEFAULT_MAX_PENDING)),
+        timeout_seconds=float(os.environ.get("REMOTE_CALL_TIMEOUT_SECONDS", DEFAULT_TIMEOUT_SECONDS)),
+    )
+
+def create_vector_retriever(backend, cache=None, runner=None):
+    if backend == "pinecone":
+        return PineconeRetriever(os.environ.get("PINECONE_INDEX_NAME", PINECONE_INDEX_NAME), cache=cache, runner=runner)
+    if backend == "local":
+        nprobe = os.environ.get("LOCAL_INDEX_NPROBE")
+        return LocalRetriever(os.environ.get("LOCAL_INDEX_DIR", LOCAL_INDEX_DIR), int(nprobe) if nprobe else None, cache=cache, runner=runner,
+                              embedding_model=os.environ.get("LOCAL_EMBEDDING_MODEL"))
+    raise ValueError(f"Unknown RETRIEVAL_BACKEND '{backend}', expected 'pinecone' or 'local'.")
+
+def create_retriever(backend=None, cache=None, runner=None):
+    retriever = create_vector_retriever(backend or os.environ.get("RETRIEVAL_BACKEND", "pinecone"), cache, runner or create_call_runner())
+    lexical_index_dir = os.environ.get("LEXICAL_INDEX_DIR", LEXICAL_INDEX_DIR)
+    if not lexical_index_dir or not os.path.isdir(lexical_index_dir):
+        return retriever
+    from lexical_index import LexicalIndex
+    return HybridRetriever(retriever, LexicalIndex(lexical_index_dir))
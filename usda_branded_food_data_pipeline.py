@@ -1,15 +1,32 @@
 import os
 import re
+import sys
 import csv
+import json
+import time
+import hashlib
+import argparse
 import shutil
 import zipfile
+import threading
+import contextlib
 import requests
 import pandas as pd
 import numpy as np
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.chrome.service import Service
-from webdriver_manager.chrome import ChromeDriverManager
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from collections.abc import Iterable, Iterator
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import repeat
+from multiprocessing import resource_tracker, shared_memory
+from urllib.parse import urljoin
+from requests.adapters import HTTPAdapter
+
+try:
+    import resource
+except ImportError:
+    resource = None
 
 thresholds: dict[str, int] = {
     'VITAMIN A, IU (IU)': 333333,
@@ -22,40 +39,186 @@ thresholds: dict[str, int] = {
     'ENERGY (KJ)': 3766,
 }
 
-def download_usda_food_data() -> str | None:
-    options = Options()
-    options.add_argument("--log-level=3")
-    driver = webdriver.Chrome(service=Service(ChromeDriverManager().install()), options=options)
-    driver.get('https://fdc.nal.usda.gov/download-datasets.html')
+DOWNLOAD_PAGE_URL = "https://fdc.nal.usda.gov/download-datasets.html"
+DOWNLOAD_WORKERS = 8
+DOWNLOAD_SEGMENT_BYTES = 64 * 1024 * 1024
+DOWNLOAD_BUFFER_BYTES = 1024 * 1024
+DOWNLOAD_TIMEOUT = 60
+DOWNLOAD_MAX_RETRIES = 5
 
-    try:
-        match = re.search(r'Full Download of All Data Types.*?href="(/fdc-datasets/FoodData_Central_csv_.*?\.zip)"',
-                          driver.page_source, re.DOTALL)
-        download_link = f"https://fdc.nal.usda.gov{match.group(1)}" if match else None
-
-        if download_link:
-            response = requests.get(download_link, stream=True)
-            filepath = os.path.join(os.getcwd(), download_link.split('/')[-1])
-
-            with open(filepath, 'wb') as file:
-                for chunk in response.iter_content(chunk_size=8192):
-                    file.write(chunk)
-            return filepath
+FOOD_NUTRIENT_COLUMNS: dict[str, str] = {'fdc_id': 'int64', 'nutrient_id': 'int64', 'amount': 'float64'}
+FOOD_NUTRIENT_ROW_BYTES = 256
+DEFAULT_MAX_MEMORY_MB = 1024
+
+OUTPUT_PATH = "usda_branded_food_data.csv"
+STATE_PATH = "usda_branded_food_data_state.npz"
+CHANGES_PATH = "usda_branded_food_data_changes.json"
+PARQUET_PATH = "usda_branded_food_data_parquet"
+PARQUET_ROWS_PER_FILE = 500_000
+PARQUET_ROW_GROUP_SIZE = 50_000
+ANALYTICS_PATH = "usda_branded_food_data_analytics"
+ANALYTICS_PERCENTILES = [1, 5, 25, 50, 75, 95, 99]
+ANALYTICS_RECORD_COLUMNS = ['FOOD_RECORD_ID', 'FOOD_ID', 'FOOD_NAME', 'FOOD_SERVING_SIZE']
+DEFAULT_WORKERS = 1
+SHARDS_PER_WORKER = 4
+
+TARGET_FILES = ["branded_food.csv", "food.csv", "nutrient.csv", "food_nutrient.csv"]
+FIXED_COLUMNS = ['FOOD_RECORD_ID', 'FOOD_ID', 'FOOD_NAME', 'FOOD_SERVING_SIZE', 'FOOD_INGREDIENTS']
+
+def find_usda_food_data_link(page_url: str = DOWNLOAD_PAGE_URL) -> str | None:
+    response = requests.get(page_url, timeout=DOWNLOAD_TIMEOUT)
+    response.raise_for_status()
+
+    match = re.search(r'Full Download of All Data Types.*?href="([^"]*/fdc-datasets/FoodData_Central_csv_[^"]*?\.zip)"',
+                      response.text, re.DOTALL)
+    if match:
+        return urljoin(page_url, match.group(1))
+
+    # Fall back to the newest full CSV release linked anywhere on the page.
+    links = re.findall(r'href="([^"]*/fdc-datasets/FoodData_Central_csv_\d{4}-\d{2}-\d{2}\.zip)"', response.text)
+    return urljoin(page_url, max(links, key=get_release_name)) if links else None
+
+def get_release_name(download_link: str) -> str:
+    return os.path.splitext(download_link.split('/')[-1])[0]
+
+def create_download_session(workers: int) -> requests.Session:
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+def probe_download(session: requests.Session, download_link: str) -> tuple[int | None, bool, str | None]:
+    response = session.head(download_link, allow_redirects=True, timeout=DOWNLOAD_TIMEOUT)
+    response.raise_for_status()
+    size = int(response.headers['Content-Length']) if 'Content-Length' in response.headers else None
+    accepts_ranges = response.headers.get('Accept-Ranges', '').lower() == 'bytes'
+    validator = response.headers.get('ETag') or response.headers.get('Last-Modified')
+    return size, accepts_ranges, validator
+
+def load_download_state(state_path: str, download_link: str, size: int, validator: str | None) -> set[int]:
+    if not os.path.exists(state_path):
+        return set()
+    with open(state_path) as file:
+        state = json.load(file)
+    if (state['url'], state['size'], state['validator'], state['segment_bytes']) != (download_link, size, validator, DOWNLOAD_SEGMENT_BYTES):
+        return set()
+    return set(state['completed_segments'])
+
+def save_download_state(state_path: str, download_link: str, size: int, validator: str | None, completed_segments: set[int]) -> None:
+    temp_path = f"{state_path}.tmp"
+    with open(temp_path, 'w') as file:
+        json.dump({
+            'url': download_link,
+            'size': size,
+            'validator': validator,
+            'segment_bytes': DOWNLOAD_SEGMENT_BYTES,
+            'completed_segments': sorted(completed_segments),
+        }, file)
+    os.replace(temp_path, state_path)
+
+def download_segment(session: requests.Session, download_link: str, filepath: str, start: int, end: int) -> None:
+    for attempt in range(DOWNLOAD_MAX_RETRIES):
+        try:
+            headers = {'Range': f'bytes={start}-{end}'}
+            with session.get(download_link, headers=headers, stream=True, timeout=DOWNLOAD_TIMEOUT) as response:
+                if response.status_code != 206:
+                    raise IOError(f"Expected a partial response for bytes {start}-{end}, got HTTP {response.status_code}.")
+                written = 0
+                with open(filepath, 'r+b', buffering=0) as file:
+                    file.seek(start)
+                    for chunk in response.iter_content(chunk_size=DOWNLOAD_BUFFER_BYTES):
+                        written += file.write(chunk[:end - start + 1 - written])
+                if written != end - start + 1:
+                    raise IOError(f"Received {written} of {end - start + 1} bytes for bytes {start}-{end}.")
+            return
+        except (requests.RequestException, IOError) as e:
+            print(f"Download of bytes {start}-{end} failed on attempt {attempt + 1}: {e}")
+            if attempt == DOWNLOAD_MAX_RETRIES - 1:
+                raise
+            time.sleep(2 ** attempt)
+
+def download_segments(session: requests.Session, download_link: str, filepath: str, size: int, validator: str | None, workers: int) -> None:
+    state_path = f"{filepath}.download.json"
+    segments = [(start, min(start + DOWNLOAD_SEGMENT_BYTES, size) - 1) for start in range(0, size, DOWNLOAD_SEGMENT_BYTES)]
+    completed_segments = load_download_state(state_path, download_link, size, validator) if os.path.exists(filepath) else set()
+    if completed_segments:
+        print(f"Resuming download with {len(completed_segments)} of {len(segments)} segments already on disk.")
+
+    with open(filepath, 'r+b' if os.path.exists(filepath) else 'wb') as file:
+        file.truncate(size)
+
+    lock = threading.Lock()
+
+    def fetch(segment: int) -> None:
+        download_segment(session, download_link, filepath, *segments[segment])
+        with lock:
+            completed_segments.add(segment)
+            save_download_state(state_path, download_link, size, validator, completed_segments)
+
+    pending_segments = [segment for segment in range(len(segments)) if segment not in completed_segments]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for future in [executor.submit(fetch, segment) for segment in pending_segments]:
+            future.result()
+
+def download_whole_file(session: requests.Session, download_link: str, filepath: str) -> None:
+    with session.get(download_link, stream=True, timeout=DOWNLOAD_TIMEOUT) as response:
+        response.raise_for_status()
+        with open(filepath, 'wb') as file:
+            for chunk in response.iter_content(chunk_size=DOWNLOAD_BUFFER_BYTES):
+                file.write(chunk)
+
+def verify_download(filepath: str, expected_size: int | None, expected_sha256: str | None) -> bool:
+    if expected_size is not None and os.path.getsize(filepath) != expected_size:
+        print(f"{filepath} is {os.path.getsize(filepath)} bytes, expected {expected_size}.")
+        return False
+
+    if expected_sha256:
+        digest = hashlib.sha256()
+        with open(filepath, 'rb') as file:
+            for block in iter(lambda: file.read(DOWNLOAD_BUFFER_BYTES), b''):
+                digest.update(block)
+        if digest.hexdigest() != expected_sha256.lower():
+            print(f"{filepath} has SHA-256 {digest.hexdigest()}, expected {expected_sha256}.")
+            return False
+
+    if not zipfile.is_zipfile(filepath):
+        print(f"{filepath} is not a valid zip archive.")
+        return False
+    return True
+
+def download_usda_food_data(download_link: str, workers: int = DOWNLOAD_WORKERS, expected_sha256: str | None = None) -> str | None:
+    filepath = os.path.join(os.getcwd(), download_link.split('/')[-1])
+    state_path = f"{filepath}.download.json"
+
+    with create_download_session(workers) as session:
+        size, accepts_ranges, validator = probe_download(session, download_link)
+        if size and accepts_ranges:
+            download_segments(session, download_link, filepath, size, validator, workers)
         else:
-            print("CSV link not found.")
-            return None
-    finally:
-        driver.quit()
+            download_whole_file(session, download_link, filepath)
+
+    if not verify_download(filepath, size, expected_sha256):
+        cleanup([filepath, state_path])
+        return None
+    cleanup([state_path])
+    return filepath
 
-def extract_zip(zip_path: str, extract_to: str) -> None:
-    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-        zip_ref.extractall(extract_to)
+def find_zip_members(zip_ref: zipfile.ZipFile, target_files: list[str]) -> dict[str, str] | None:
+    members = {os.path.basename(name): name for name in zip_ref.namelist() if not name.endswith('/')}
+    missing_files = [file_name for file_name in target_files if file_name not in members]
+    if missing_files:
+        print(f"{zip_ref.filename} is missing {', '.join(missing_files)}.")
+        return None
+    return {file_name: members[file_name] for file_name in target_files}
 
-def move_target_files(source_folder: str, target_files: list[str]) -> None:
-    for file_name in target_files:
-        source_path = os.path.join(source_folder, file_name)
-        if os.path.exists(source_path):
-            shutil.move(source_path, os.getcwd())
+def read_zip_csv(zip_ref: zipfile.ZipFile, member: str) -> pd.DataFrame:
+    with zip_ref.open(member) as file:
+        return pd.read_csv(file, low_memory=False)
+
+def read_food_nutrient_chunks(zip_ref: zipfile.ZipFile, member: str, chunk_size: int) -> Iterator[pd.DataFrame]:
+    with zip_ref.open(member) as file:
+        yield from pd.read_csv(file, usecols=list(FOOD_NUTRIENT_COLUMNS), dtype=FOOD_NUTRIENT_COLUMNS, chunksize=chunk_size)
 
 def cleanup(files_to_delete: list[str]) -> None:
     for path in files_to_delete:
@@ -64,33 +227,60 @@ def cleanup(files_to_delete: list[str]) -> None:
         elif os.path.isdir(path):
             shutil.rmtree(path)
 
-def clean_branded_food(branded_food_df: pd.DataFrame) -> pd.DataFrame:
+def select_latest_branded_food(branded_food_df: pd.DataFrame) -> pd.DataFrame:
     df_sorted = branded_food_df.sort_values(by=['gtin_upc', 'fdc_id'], ascending=[True, False])
     df_latest = df_sorted.drop_duplicates(subset='gtin_upc', keep='first')
     df_filtered = df_latest[['fdc_id', 'gtin_upc', 'ingredients', 'serving_size', 'serving_size_unit']].rename(
         columns={'fdc_id': 'FOOD_RECORD_ID', 'gtin_upc': 'FOOD_ID', 'ingredients': 'FOOD_INGREDIENTS'}
     )
+    return df_filtered.sort_values(by='FOOD_RECORD_ID')
+
+def normalize_strings(values: pd.Series) -> pd.Series:
+    # Strips and upper-cases with Arrow's string kernels in one pass over the column instead of a Python call per value.
+    # pandas 3 already reads text as Arrow-backed strings; object columns are converted, and handed back as object.
+    if not pd.api.types.is_object_dtype(values.dtype):
+        return values.str.strip().str.upper()
+    try:
+        array = pa.array(values, type=pa.string(), from_pandas=True)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # Mixed-type columns keep the old behavior, where non-string values become NaN.
+        return values.str.strip().str.upper()
+    normalized = pc.utf8_upper(pc.utf8_trim_whitespace(array)).to_numpy(zero_copy_only=False)
+    return pd.Series(normalized, index=values.index, dtype=object).fillna(np.nan)
+
+def normalize_branded_food(df_filtered: pd.DataFrame) -> pd.DataFrame:
+    df_filtered = df_filtered.copy()
     for col in df_filtered.select_dtypes(include='object').columns:
-        df_filtered[col] = df_filtered[col].str.strip().str.upper()
+        df_filtered[col] = normalize_strings(df_filtered[col])
 
-    df_filtered['serving_size'] = pd.to_numeric(df_filtered['serving_size'], errors='coerce').round(2)
-    df_filtered['FOOD_SERVING_SIZE'] = (
-        df_filtered['serving_size'].astype(str).str.strip() + ' ' + df_filtered['serving_size_unit'].str.strip().str.upper()
-    )
-    return df_filtered.drop(columns=['serving_size', 'serving_size_unit']).sort_values(by='FOOD_RECORD_ID')
+    # Serving sizes stay split into a number and a categorical unit; the "<size> <UNIT>" text is only built for the rows that are kept.
+    df_filtered['SERVING_SIZE_VALUE'] = pd.to_numeric(df_filtered['serving_size'], errors='coerce').round(2)
+    df_filtered['SERVING_SIZE_UNIT'] = df_filtered['serving_size_unit'].astype('category')
+    return df_filtered.drop(columns=['serving_size', 'serving_size_unit'])
+
+def clean_branded_food(branded_food_df: pd.DataFrame) -> pd.DataFrame:
+    return normalize_branded_food(select_latest_branded_food(branded_food_df))
+
+def normalize_food_names(food_df: pd.DataFrame) -> pd.DataFrame:
+    return food_df.assign(FOOD_NAME=normalize_strings(food_df['FOOD_NAME']))
 
 def clean_food(food_df: pd.DataFrame, cleaned_branded_food_df: pd.DataFrame) -> pd.DataFrame:
     food_df = food_df.rename(columns={'fdc_id': 'FOOD_RECORD_ID', 'description': 'FOOD_NAME'})
-    food_df['FOOD_NAME'] = food_df['FOOD_NAME'].str.strip().str.upper()
-    return food_df[food_df['FOOD_RECORD_ID'].isin(cleaned_branded_food_df['FOOD_RECORD_ID'])][['FOOD_RECORD_ID', 'FOOD_NAME']]
+    food_df = food_df[food_df['FOOD_RECORD_ID'].isin(cleaned_branded_food_df['FOOD_RECORD_ID'])][['FOOD_RECORD_ID', 'FOOD_NAME']]
+    return normalize_food_names(food_df)
 
 def clean_nutrient(nutrient_df: pd.DataFrame) -> pd.DataFrame:
     nutrient_df = nutrient_df.rename(columns={'id': 'NUTRIENT_ID', 'name': 'NUTRIENT_NAME', 'unit_name': 'NUTRIENT_UNIT'})
     nutrient_df['FOOD_NUTRIENT_NAME'] = (
-        nutrient_df['NUTRIENT_NAME'].str.upper().str.strip() + ' (' + nutrient_df['NUTRIENT_UNIT'].str.upper().str.strip() + ')'
+        normalize_strings(nutrient_df['NUTRIENT_NAME']) + ' (' + normalize_strings(nutrient_df['NUTRIENT_UNIT']) + ')'
     )
     return nutrient_df[['NUTRIENT_ID', 'FOOD_NUTRIENT_NAME']]
 
+def to_nutrient_store(aggregated_df: pd.DataFrame) -> pd.DataFrame:
+    nutrient_store = aggregated_df[["FOOD_RECORD_ID", "NUTRIENT_ID", "NUTRIENT_QUANTITY"]].sort_values(by=["FOOD_RECORD_ID", "NUTRIENT_ID"])
+    nutrient_store['NUTRIENT_ID'] = nutrient_store['NUTRIENT_ID'].astype('category')
+    return nutrient_store.reset_index(drop=True)
+
 def clean_food_nutrient(cleaned_branded_food_df: pd.DataFrame, food_nutrient_df: pd.DataFrame) -> pd.DataFrame:
     food_nutrient_df = food_nutrient_df.rename(columns={
         "fdc_id": "FOOD_RECORD_ID",
@@ -98,68 +288,638 @@ def clean_food_nutrient(cleaned_branded_food_df: pd.DataFrame, food_nutrient_df:
         "amount": "NUTRIENT_QUANTITY"
     })
     filtered_food_nutrient_df = food_nutrient_df[food_nutrient_df['FOOD_RECORD_ID'].isin(cleaned_branded_food_df['FOOD_RECORD_ID'])]
-    aggregated_df = filtered_food_nutrient_df.groupby(["FOOD_RECORD_ID", "NUTRIENT_ID"], as_index=False).mean()
-    return aggregated_df.pivot(index="FOOD_RECORD_ID", columns="NUTRIENT_ID", values="NUTRIENT_QUANTITY").reset_index()
+    aggregated_df = filtered_food_nutrient_df.groupby(["FOOD_RECORD_ID", "NUTRIENT_ID"], as_index=False)["NUTRIENT_QUANTITY"].mean()
+    return to_nutrient_store(aggregated_df)
+
+def food_nutrient_chunk_size(max_memory_mb: int) -> int:
+    # Half of the budget goes to the chunk being parsed, the other half to the running sums.
+    return max(1, (max_memory_mb * 1024 * 1024) // (2 * FOOD_NUTRIENT_ROW_BYTES))
+
+def combine_partial_sums(partials: list[pd.DataFrame]) -> pd.DataFrame:
+    if len(partials) == 1:
+        return partials[0]
+    return pd.concat(partials).groupby(level=[0, 1]).sum()
+
+def stream_clean_food_nutrient(cleaned_branded_food_df: pd.DataFrame, food_nutrient_chunks: Iterable[pd.DataFrame], chunk_size: int) -> pd.DataFrame:
+    record_ids = pd.Index(cleaned_branded_food_df['FOOD_RECORD_ID'].unique())
+    partials: list[pd.DataFrame] = []
+    pending_rows = 0
+    compacted_rows = 0
 
-def map_nutrient_names_to_nutrient_ids(cleaned_nutrient_df: pd.DataFrame, cleaned_food_nutrient_df: pd.DataFrame) -> pd.DataFrame:
+    for chunk in food_nutrient_chunks:
+        chunk = chunk[chunk['fdc_id'].isin(record_ids)]
+        if chunk.empty:
+            continue
+        partial = chunk.groupby(['fdc_id', 'nutrient_id'])['amount'].agg(['sum', 'count'])
+        partials.append(partial)
+        pending_rows += len(partial)
+        # Only compact once the pending partials outgrow both the chunk and the running totals,
+        # so the merge cost stays proportional to the output rather than to the number of chunks.
+        if pending_rows > max(chunk_size, 2 * compacted_rows):
+            partials = [combine_partial_sums(partials)]
+            compacted_rows = pending_rows = len(partials[0])
+
+    if not partials:
+        return to_nutrient_store(pd.DataFrame({"FOOD_RECORD_ID": pd.Series(dtype='int64'), "NUTRIENT_ID": pd.Series(dtype='int64'),
+                                               "NUTRIENT_QUANTITY": pd.Series(dtype='float64')}))
+
+    totals = combine_partial_sums(partials)
+    aggregated_df = (totals['sum'] / totals['count'].where(totals['count'] > 0)).rename('NUTRIENT_QUANTITY')
+    aggregated_df.index.names = ["FOOD_RECORD_ID", "NUTRIENT_ID"]
+    return to_nutrient_store(aggregated_df.reset_index())
+
+def map_nutrient_names_to_nutrient_ids(cleaned_nutrient_df: pd.DataFrame, cleaned_food_nutrient_df: pd.DataFrame) -> pd.Series:
+    nutrient_ids = cleaned_food_nutrient_df['NUTRIENT_ID'].cat.categories
     nutrient_map = dict(zip(cleaned_nutrient_df['NUTRIENT_ID'], cleaned_nutrient_df['FOOD_NUTRIENT_NAME']))
-    return cleaned_food_nutrient_df.rename(columns=nutrient_map)
+    return pd.Series([nutrient_map.get(nutrient_id, str(nutrient_id)) for nutrient_id in nutrient_ids], index=nutrient_ids)
 
-def merge_cleaned_data_into_final_df(cleaned_branded_food_df: pd.DataFrame, cleaned_food_df: pd.DataFrame, mapped_nutrient_names_to_nutrient_ids_df: pd.DataFrame) -> pd.DataFrame:
-    merged_data = pd.merge(cleaned_branded_food_df, cleaned_food_df, on='FOOD_RECORD_ID', how='inner')
-    final_data = pd.merge(merged_data, mapped_nutrient_names_to_nutrient_ids_df, on='FOOD_RECORD_ID', how='inner')
-    ordered_columns = ['FOOD_RECORD_ID', 'FOOD_ID', 'FOOD_NAME', 'FOOD_SERVING_SIZE', 'FOOD_INGREDIENTS'] + sorted(
-        [col for col in final_data.columns if col not in ['FOOD_RECORD_ID', 'FOOD_ID', 'FOOD_NAME', 'FOOD_SERVING_SIZE', 'FOOD_INGREDIENTS']]
-    )
+def order_final_columns(final_data: pd.DataFrame) -> pd.DataFrame:
+    ordered_columns = FIXED_COLUMNS + sorted([col for col in final_data.columns if col not in FIXED_COLUMNS])
     return final_data[ordered_columns]
 
-def apply_nutrient_thresholds(final_data: pd.DataFrame) -> pd.DataFrame:
-    nutrient_columns = final_data.columns[final_data.columns.get_loc('FOOD_SERVING_SIZE') + 1:]
-    for column in nutrient_columns:
-        unit = column.split('(')[-1].replace(')', '').strip()
-        threshold = thresholds.get(column, thresholds.get(unit))
-        if threshold is not None:
-            final_data[column] = final_data[column].where(final_data[column] <= threshold, np.nan)
-    final_data[nutrient_columns] = final_data[nutrient_columns].round(2)
-    return final_data
+def merge_cleaned_data_into_final_df(cleaned_branded_food_df: pd.DataFrame, cleaned_food_df: pd.DataFrame, cleaned_food_nutrient_df: pd.DataFrame) -> pd.DataFrame:
+    merged_data = pd.merge(cleaned_branded_food_df, cleaned_food_df, on='FOOD_RECORD_ID', how='inner')
+    merged_data = merged_data[merged_data['FOOD_RECORD_ID'].isin(cleaned_food_nutrient_df['FOOD_RECORD_ID'].unique())]
+    return merged_data[['FOOD_RECORD_ID', 'FOOD_ID', 'FOOD_NAME', 'SERVING_SIZE_VALUE', 'SERVING_SIZE_UNIT', 'FOOD_INGREDIENTS']].reset_index(drop=True)
+
+def get_nutrient_thresholds(nutrient_names: pd.Series) -> np.ndarray:
+    units = nutrient_names.str.split('(').str[-1].str.replace(')', '').str.strip()
+    return np.array([thresholds.get(name, thresholds.get(unit, np.nan)) for name, unit in zip(nutrient_names, units)], dtype='float64')
+
+def apply_nutrient_thresholds(cleaned_food_nutrient_df: pd.DataFrame, nutrient_names: pd.Series) -> pd.DataFrame:
+    limits = get_nutrient_thresholds(nutrient_names)[cleaned_food_nutrient_df['NUTRIENT_ID'].cat.codes.to_numpy()]
+    quantities = cleaned_food_nutrient_df['NUTRIENT_QUANTITY'].to_numpy()
+    # NaN limits mean "no threshold"; values above a limit become NaN exactly like the wide table used to.
+    quantities = np.where(np.isnan(limits) | (quantities <= limits), quantities, np.nan)
+    return cleaned_food_nutrient_df.assign(NUTRIENT_QUANTITY=np.round(quantities, 2))
 
 def remove_invalid_serving_sizes(final_data: pd.DataFrame) -> pd.DataFrame:
-    final_data = final_data[~final_data['FOOD_SERVING_SIZE'].str.contains("IU", na=False)]
-    final_data = final_data.dropna(subset=['FOOD_SERVING_SIZE'])
-    return final_data
+    # The number never contains "IU", so testing the few distinct units matches the old substring scan of the full text.
+    units = final_data['SERVING_SIZE_UNIT'].cat.categories
+    invalid_unit_codes = np.flatnonzero(units.str.contains("IU"))
+    unit_codes = final_data['SERVING_SIZE_UNIT'].cat.codes.to_numpy()
+    return final_data[(unit_codes >= 0) & ~np.isin(unit_codes, invalid_unit_codes)]
+
+def format_serving_sizes(final_data: pd.DataFrame) -> pd.DataFrame:
+    # Converts each distinct size to text once, with the same conversion the old text column used, and joins it
+    # to its unit per distinct (size, unit) pair. Expects rows without a unit to have been removed already.
+    units = pa.array(final_data['SERVING_SIZE_UNIT'].cat.categories.to_numpy(dtype=object), type=pa.string())
+    unit_count = max(len(units), 1)
+    size_codes, sizes = pd.factorize(final_data['SERVING_SIZE_VALUE'], use_na_sentinel=False)
+    size_text = pa.array(pd.Series(np.asarray(sizes, dtype='float64')).astype(str).str.strip(), type=pa.string(), from_pandas=True)
+    pair_codes, pairs = pd.factorize(size_codes.astype('int64') * unit_count + final_data['SERVING_SIZE_UNIT'].cat.codes.to_numpy())
+    pair_text = pc.binary_join_element_wise(size_text.take(pairs // unit_count), units.take(pairs % unit_count), ' ')
+
+    # Sizes that did not parse may format to null and are dropped, like the missing values of the old text column.
+    valid_pairs = pair_text.is_valid().to_numpy(zero_copy_only=False)
+    category_codes = np.where(valid_pairs, np.cumsum(valid_pairs) - 1, -1)
+    categories = pd.Index(pair_text.filter(pa.array(valid_pairs)).to_numpy(zero_copy_only=False), dtype=object)
+    final_data = final_data.assign(FOOD_SERVING_SIZE=pd.Categorical.from_codes(category_codes[pair_codes], categories=categories))
+    return final_data[FIXED_COLUMNS].dropna(subset=['FOOD_SERVING_SIZE'])
+
+def build_wide_food_data(final_foods: pd.DataFrame, cleaned_food_nutrient_df: pd.DataFrame, nutrient_names: pd.Series) -> pd.DataFrame:
+    rows = pd.Index(final_foods['FOOD_RECORD_ID']).get_indexer(cleaned_food_nutrient_df['FOOD_RECORD_ID'])
+    columns = cleaned_food_nutrient_df['NUTRIENT_ID'].cat.codes.to_numpy()
+    kept = rows >= 0
+
+    nutrient_values = np.full((len(final_foods), len(nutrient_names)), np.nan)
+    nutrient_values[rows[kept], columns[kept]] = cleaned_food_nutrient_df['NUTRIENT_QUANTITY'].to_numpy()[kept]
+
+    column_order = np.argsort(nutrient_names.to_numpy(dtype=str), kind='stable')
+    nutrient_df = pd.DataFrame(nutrient_values[:, column_order], columns=nutrient_names.to_numpy()[column_order], index=final_foods.index)
+    return pd.concat([final_foods, nutrient_df], axis=1)
+
+def hash_rows(df: pd.DataFrame) -> pd.Series:
+    return pd.util.hash_pandas_object(df, index=False)
+
+def hash_transform_inputs(cleaned_nutrient_df: pd.DataFrame) -> str:
+    digest = hashlib.sha256(hash_rows(cleaned_nutrient_df).values.tobytes())
+    digest.update(json.dumps(thresholds, sort_keys=True).encode())
+    return digest.hexdigest()
+
+def hash_food_records(cleaned_branded_food_df: pd.DataFrame, cleaned_food_df: pd.DataFrame, food_nutrient_chunks: Iterable[pd.DataFrame]) -> pd.Series:
+    record_ids = pd.Index(cleaned_branded_food_df['FOOD_RECORD_ID'])
+    branded_hashes = pd.Series(hash_rows(cleaned_branded_food_df).values, index=record_ids)
+    food_hashes = pd.Series(hash_rows(cleaned_food_df).values, index=cleaned_food_df['FOOD_RECORD_ID'].values)
+
+    # Summing the per-row hashes (with uint64 wraparound) makes each record's digest independent of row order.
+    nutrient_hashes = []
+    for chunk in food_nutrient_chunks:
+        chunk = chunk[chunk['fdc_id'].isin(record_ids)]
+        row_hashes = hash_rows(chunk[['nutrient_id', 'amount']])
+        nutrient_hashes.append(row_hashes.groupby(chunk['fdc_id'].values).sum())
+    food_nutrient_hashes = pd.concat(nutrient_hashes).groupby(level=0).sum() if nutrient_hashes else pd.Series(dtype='uint64')
+
+    components = pd.DataFrame({
+        'branded_food': branded_hashes,
+        'food': food_hashes.reindex(record_ids, fill_value=0),
+        'food_nutrient': food_nutrient_hashes.reindex(record_ids, fill_value=0),
+    })
+    return pd.Series(hash_rows(components).values, index=record_ids)
+
+def load_pipeline_state(state_path: str) -> dict | None:
+    if not os.path.exists(state_path):
+        return None
+    with np.load(state_path) as state:
+        return {
+            'release': str(state['release']),
+            'transform_hash': str(state['transform_hash']),
+            'record_ids': state['record_ids'],
+            'record_hashes': state['record_hashes'],
+        }
+
+def save_pipeline_state(state_path: str, release: str, transform_hash: str, record_hashes: pd.Series) -> None:
+    temp_path = f"{state_path}.tmp"
+    with open(temp_path, 'wb') as file:
+        np.savez(file, release=np.array(release), transform_hash=np.array(transform_hash),
+                 record_ids=record_hashes.index.to_numpy(dtype='int64'), record_hashes=record_hashes.to_numpy(dtype='uint64'))
+    os.replace(temp_path, state_path)
+
+def diff_food_records(state: dict | None, transform_hash: str, record_hashes: pd.Series) -> tuple[pd.Index, pd.Index]:
+    if state is None:
+        return record_hashes.index, pd.Index([], dtype='int64')
+
+    previous_ids = pd.Index(state['record_ids'])
+    removed_ids = previous_ids.difference(record_hashes.index)
+    if state['transform_hash'] != transform_hash:
+        return record_hashes.index, removed_ids
+
+    previous = pd.MultiIndex.from_arrays([state['record_ids'], state['record_hashes']])
+    current = pd.MultiIndex.from_arrays([record_hashes.index, record_hashes.values])
+    return record_hashes.index[~current.isin(previous)], removed_ids
+
+def patch_final_data(existing_path: str, final_data: pd.DataFrame, replaced_ids: pd.Index) -> pd.DataFrame:
+    dtype = {'FOOD_RECORD_ID': str}
+    if not pd.api.types.is_numeric_dtype(final_data['FOOD_ID']):
+        dtype['FOOD_ID'] = str
+    existing_data = pd.read_csv(existing_path, low_memory=False, dtype=dtype, float_precision='round_trip')
+    existing_data = existing_data[~existing_data['FOOD_RECORD_ID'].isin(replaced_ids.astype(str))]
+
+    patched_data = pd.concat([existing_data, final_data], ignore_index=True)
+    patched_data = patched_data.sort_values(by='FOOD_RECORD_ID', key=lambda ids: ids.astype('int64'), kind='stable')
+    return order_final_columns(patched_data)
+
+def write_changes_manifest(changes_path: str, release: str, previous_release: str | None, upserted_ids: Iterable[str], deleted_ids: Iterable[str]) -> None:
+    with open(changes_path, 'w') as file:
+        json.dump({
+            'release': release,
+            'previous_release': previous_release,
+            'upserted': list(upserted_ids),
+            'deleted': list(deleted_ids),
+        }, file)
 
-def execute_pipeline() -> None:
-    zip_file_path = download_usda_food_data()
-    if zip_file_path:
-        extract_zip(zip_file_path, os.getcwd())
-        
-        target_files = ["branded_food.csv", "food.csv", "nutrient.csv", "food_nutrient.csv"]
-        extracted_folder_path = os.path.splitext(zip_file_path)[0]
-        move_target_files(extracted_folder_path, target_files)
-        cleanup([zip_file_path, extracted_folder_path])
-
-        branded_food_df = pd.read_csv("branded_food.csv", low_memory=False)
-        food_df = pd.read_csv("food.csv", low_memory=False)
-        nutrient_df = pd.read_csv("nutrient.csv", low_memory=False)
-        food_nutrient_df = pd.read_csv("food_nutrient.csv", low_memory=False)
-
-        cleaned_branded_food_df = clean_branded_food(branded_food_df)
-        cleaned_food_df = clean_food(food_df, cleaned_branded_food_df)
-        cleaned_nutrient_df = clean_nutrient(nutrient_df)
-        cleaned_food_nutrient_df = clean_food_nutrient(cleaned_branded_food_df, food_nutrient_df)
-        mapped_nutrient_names_to_nutrient_ids_df = map_nutrient_names_to_nutrient_ids(cleaned_nutrient_df, cleaned_food_nutrient_df)
-        
-        final_data = merge_cleaned_data_into_final_df(cleaned_branded_food_df, cleaned_food_df, mapped_nutrient_names_to_nutrient_ids_df)
-
-        final_data = final_data.dropna(subset=['FOOD_INGREDIENTS'])        
-        final_data = apply_nutrient_thresholds(final_data)
-        final_data = remove_invalid_serving_sizes(final_data)
+def fits_float32(values: np.ndarray) -> bool:
+    # Rounding a float32 cast to 2 decimals gives back a 2-decimal value only below 2**17; above that the float32 spacing
+    # exceeds 0.01 (333332.57 comes back as 333332.56), so nutrients that reach such values are stored as float64.
+    values = values[~np.isnan(values)]
+    return bool(np.array_equal(np.round(values.astype('float32').astype('float64'), 2), values))
 
+def get_nutrient_type(values: np.ndarray) -> pa.DataType:
+    return pa.float32() if fits_float32(values) else pa.float64()
+
+def build_parquet_schema(final_data: pd.DataFrame) -> pa.Schema:
+    return pa.schema([
+        pa.field('FOOD_RECORD_ID', pa.string()),
+        pa.field('FOOD_ID', pa.string()),
+        pa.field('FOOD_NAME', pa.string()),
+        pa.field('FOOD_SERVING_SIZE', pa.dictionary(pa.int32(), pa.string())),
+        pa.field('FOOD_INGREDIENTS', pa.string()),
+    ] + [pa.field(column, get_nutrient_type(final_data[column].to_numpy(dtype='float64')))
+         for column in final_data.columns if column not in FIXED_COLUMNS])
+
+def write_parquet_dataset(final_data: pd.DataFrame, parquet_path: str) -> None:
+    schema = build_parquet_schema(final_data)
+    final_data = final_data.assign(FOOD_ID=final_data['FOOD_ID'].where(final_data['FOOD_ID'].isna(), final_data['FOOD_ID'].astype(str)))
+
+    temp_path = f"{parquet_path}.tmp"
+    cleanup([temp_path])
+    os.makedirs(temp_path)
+    for part, start in enumerate(range(0, len(final_data), PARQUET_ROWS_PER_FILE)):
+        table = pa.Table.from_pandas(final_data.iloc[start:start + PARQUET_ROWS_PER_FILE], schema=schema, preserve_index=False)
+        pq.write_table(table, os.path.join(temp_path, f"part-{part:05d}.parquet"),
+                       row_group_size=PARQUET_ROW_GROUP_SIZE, compression='zstd')
+    cleanup([parquet_path])
+    os.replace(temp_path, parquet_path)
+
+def summarize_nutrient(name: str, values: np.ndarray) -> dict:
+    if not len(values):
+        return {'name': name, 'count': 0, 'min': None, 'max': None, 'mean': None, 'percentiles': None}
+    percentiles = np.percentile(values, ANALYTICS_PERCENTILES)
+    return {
+        'name': name,
+        'count': len(values),
+        'min': round(float(values.min()), 2),
+        'max': round(float(values.max()), 2),
+        'mean': round(float(values.mean()), 4),
+        'percentiles': {str(p): round(float(v), 4) for p, v in zip(ANALYTICS_PERCENTILES, percentiles)},
+    }
+
+def write_analytics(final_data: pd.DataFrame, analytics_path: str, release: str) -> None:
+    # Precomputed artifacts for utils/query_food_analytics.py, in the row order of the CSV. Every array is a plain .npy
+    # file, so queries memory-map only the columns they touch instead of reloading the whole table.
+    nutrient_columns = [column for column in final_data.columns if column not in FIXED_COLUMNS]
+    values = final_data[nutrient_columns].to_numpy(dtype='float64')
+    populated = ~np.isnan(values)
+    # One dtype for the whole matrix: float32 unless some nutrient holds values it cannot keep exact.
+    dtype = 'float32' if fits_float32(values.ravel()) else 'float64'
+
+    # One segment per nutrient holding its populated rows in ascending value order, so top-k reads the segment ends and
+    # range queries binary-search the segment.
+    sorted_rows, sorted_values, summaries = [], [], []
+    for column_id, column in enumerate(nutrient_columns):
+        rows = np.flatnonzero(populated[:, column_id])
+        rows = rows[np.argsort(values[rows, column_id], kind='stable')]
+        sorted_rows.append(rows.astype('int32'))
+        sorted_values.append(values[rows, column_id].astype(dtype))
+        summaries.append(summarize_nutrient(column, values[rows, column_id]))
+    sorted_offsets = np.cumsum([0] + [len(rows) for rows in sorted_rows], dtype='int64')
+
+    temp_path = f"{analytics_path}.tmp"
+    cleanup([temp_path])
+    os.makedirs(temp_path)
+    # Column-major, so each nutrient is one contiguous run of the memory-mapped file.
+    np.save(os.path.join(temp_path, "nutrients.npy"), np.asfortranarray(values, dtype=dtype))
+    np.save(os.path.join(temp_path, "populated_counts.npy"), populated.sum(axis=1).astype('uint16'))
+    np.save(os.path.join(temp_path, "populated_bitmap.npy"), np.packbits(populated, axis=1, bitorder='little'))
+    np.save(os.path.join(temp_path, "sorted_offsets.npy"), sorted_offsets)
+    np.save(os.path.join(temp_path, "sorted_rows.npy"), np.concatenate(sorted_rows or [np.empty(0, dtype='int32')]))
+    np.save(os.path.join(temp_path, "sorted_values.npy"), np.concatenate(sorted_values or [np.empty(0, dtype=dtype)]))
+
+    records = final_data[ANALYTICS_RECORD_COLUMNS]
+    records = records.assign(FOOD_ID=records['FOOD_ID'].where(records['FOOD_ID'].isna(), records['FOOD_ID'].astype(str)))
+    table = pa.Table.from_pandas(records, schema=pa.schema([pa.field(column, pa.string()) for column in ANALYTICS_RECORD_COLUMNS]), preserve_index=False)
+    # Uncompressed Arrow IPC, so the text columns are memory-mapped rather than decoded on open.
+    with pa.OSFile(os.path.join(temp_path, "records.arrow"), 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+
+    with open(os.path.join(temp_path, "summary.json"), 'w') as file:
+        json.dump({'release': release, 'rows': len(final_data), 'percentiles': ANALYTICS_PERCENTILES, 'nutrients': summaries}, file, indent=2)
+    cleanup([analytics_path])
+    os.replace(temp_path, analytics_path)
+
+def read_peak_rss_mb() -> float | None:
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak_rss / (1024 * 1024) if sys.platform == 'darwin' else peak_rss / 1024
+
+def reset_peak_rss() -> bool:
+    # Linux lets a process reset its RSS high-water mark, so each stage can report its own peak rather than the run's so far.
+    try:
+        with open('/proc/self/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+        return True
+    except OSError:
+        return False
+
+class StageProfiler:
+    def __init__(self) -> None:
+        self.stages: list[dict] = []
+        self.per_stage_peaks = True
+        self.start_wall = time.perf_counter()
+        self.start_cpu = time.process_time()
+
+    @contextlib.contextmanager
+    def stage(self, name: str, rows_in: int | None = None) -> Iterator[dict]:
+        record = {'stage': name, 'rows_in': rows_in, 'rows_out': None}
+        self.per_stage_peaks = reset_peak_rss() and self.per_stage_peaks
+        start_wall, start_cpu = time.perf_counter(), time.process_time()
+        try:
+            yield record
+        finally:
+            record['wall_seconds'] = round(time.perf_counter() - start_wall, 4)
+            record['cpu_seconds'] = round(time.process_time() - start_cpu, 4)
+            peak_rss_mb = read_peak_rss_mb()
+            record['peak_rss_mb'] = round(peak_rss_mb, 1) if peak_rss_mb is not None else None
+            self.stages.append(record)
+
+    def report(self, **details) -> dict:
+        peaks = [stage['peak_rss_mb'] for stage in self.stages if stage['peak_rss_mb'] is not None]
+        return {
+            **details,
+            'wall_seconds': round(time.perf_counter() - self.start_wall, 4),
+            # CPU time of the parent process only; with --workers the pool's CPU time is not included.
+            'cpu_seconds': round(time.process_time() - self.start_cpu, 4),
+            'peak_rss_mb': max(peaks, default=None),
+            # 'stage' when the high-water mark could be reset between stages, otherwise each value is the process peak so far.
+            'peak_rss_scope': 'stage' if self.per_stage_peaks else 'process',
+            'stages': self.stages,
+        }
+
+    def write_report(self, path: str, **details) -> None:
+        with open(path, 'w') as file:
+            json.dump(self.report(**details), file, indent=2)
+
+    def print_summary(self) -> None:
+        print(f"{'stage':<36} {'wall s':>9} {'cpu s':>9} {'peak MB':>9} {'rows in':>12} {'rows out':>12}")
+        for stage in self.stages:
+            print(f"{stage['stage']:<36} {stage['wall_seconds']:>9.2f} {stage['cpu_seconds']:>9.2f} {stage['peak_rss_mb'] or 0:>9.0f} "
+                  f"{stage['rows_in'] if stage['rows_in'] is not None else '':>12} {stage['rows_out'] if stage['rows_out'] is not None else '':>12}")
+
+def transform_cleaned_data(cleaned_branded_food_df: pd.DataFrame, cleaned_food_df: pd.DataFrame, cleaned_nutrient_df: pd.DataFrame, cleaned_food_nutrient_df: pd.DataFrame,
+                           nutrient_names: pd.Series | None = None, profiler: StageProfiler | None = None) -> pd.DataFrame:
+    profiler = profiler or StageProfiler()
+    if nutrient_names is None:
+        nutrient_names = map_nutrient_names_to_nutrient_ids(cleaned_nutrient_df, cleaned_food_nutrient_df)
+
+    with profiler.stage('merge_cleaned_data_into_final_df', len(cleaned_branded_food_df)) as stage:
+        final_foods = merge_cleaned_data_into_final_df(cleaned_branded_food_df, cleaned_food_df, cleaned_food_nutrient_df)
+
+        final_foods = final_foods.dropna(subset=['FOOD_INGREDIENTS'])
+        final_foods = format_serving_sizes(remove_invalid_serving_sizes(final_foods))
+        stage['rows_out'] = len(final_foods)
+
+    with profiler.stage('apply_nutrient_thresholds', len(cleaned_food_nutrient_df)) as stage:
+        cleaned_food_nutrient_df = cleaned_food_nutrient_df[cleaned_food_nutrient_df['FOOD_RECORD_ID'].isin(final_foods['FOOD_RECORD_ID'])]
+        cleaned_food_nutrient_df = apply_nutrient_thresholds(cleaned_food_nutrient_df, nutrient_names)
+        stage['rows_out'] = len(cleaned_food_nutrient_df)
+
+    with profiler.stage('build_wide_food_data', len(cleaned_food_nutrient_df)) as stage:
+        final_data = build_wide_food_data(final_foods, cleaned_food_nutrient_df, nutrient_names)
         final_data['FOOD_RECORD_ID'] = final_data['FOOD_RECORD_ID'].astype(str)
-        
-        final_data.to_csv("usda_branded_food_data.csv", index=False, quoting=csv.QUOTE_NONNUMERIC)
+        stage['rows_out'] = len(final_data)
+    return final_data
+
+def create_transform_executor(workers: int) -> contextlib.AbstractContextManager[ProcessPoolExecutor | None]:
+    if workers <= 1:
+        return contextlib.nullcontext()
+    # Start the tracker before forking so workers that attach to shared blocks report to the parent's tracker,
+    # instead of each starting their own one that flags the parent's blocks as leaked.
+    resource_tracker.ensure_running()
+    return ProcessPoolExecutor(max_workers=workers)
+
+def get_shard_bounds(record_ids: pd.Series, shards: int) -> np.ndarray:
+    sorted_ids = np.sort(record_ids.unique())
+    return np.array([part[0] for part in np.array_split(sorted_ids, shards) if len(part)], dtype='int64')
 
-        for file in target_files:
-            os.remove(file)
+def get_shard_positions(record_ids: np.ndarray, bounds: np.ndarray) -> np.ndarray:
+    return np.searchsorted(bounds, record_ids, side='right') - 1
 
-execute_pipeline()
\ No newline at end of file
+def split_by_record_range(df: pd.DataFrame, bounds: np.ndarray) -> list[pd.DataFrame]:
+    shard_positions = get_shard_positions(df['FOOD_RECORD_ID'].to_numpy(), bounds)
+    order = np.argsort(shard_positions, kind='stable')
+    counts = np.bincount(shard_positions + 1, minlength=len(bounds) + 1)
+    return [df.iloc[rows] for rows in np.split(order, np.cumsum(counts)[:-1])[1:]]
+
+def share_array(array: np.ndarray) -> tuple[shared_memory.SharedMemory, tuple[str, tuple[int, ...], str]]:
+    block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[:] = array
+    return block, (block.name, array.shape, array.dtype.str)
+
+def attach_array(spec: tuple[str, tuple[int, ...], str]) -> tuple[shared_memory.SharedMemory, np.ndarray]:
+    name, shape, dtype = spec
+    block = shared_memory.SharedMemory(name=name)
+    return block, np.ndarray(shape, dtype=dtype, buffer=block.buf)
+
+def partition_food_nutrient_rows(fdc_ids_spec: tuple, record_ids_spec: tuple, bounds: np.ndarray, start: int, end: int) -> list[np.ndarray]:
+    fdc_ids_block, fdc_ids = attach_array(fdc_ids_spec)
+    record_ids_block, record_ids = attach_array(record_ids_spec)
+    try:
+        ids = fdc_ids[start:end]
+        positions = np.minimum(np.searchsorted(record_ids, ids), len(record_ids) - 1)
+        rows = np.flatnonzero(record_ids[positions] == ids)
+        shard_positions = get_shard_positions(ids[rows], bounds)
+    finally:
+        del fdc_ids, record_ids, ids
+        fdc_ids_block.close()
+        record_ids_block.close()
+
+    # Rows stay in file order within every shard, so each group's mean is accumulated exactly as in the serial path.
+    order = np.argsort(shard_positions, kind='stable')
+    counts = np.bincount(shard_positions, minlength=len(bounds))
+    return np.split(rows[order] + start, np.cumsum(counts)[:-1])
+
+def aggregate_food_nutrient_shard(column_specs: dict[str, tuple], row_parts: list[np.ndarray]) -> pd.DataFrame:
+    rows = np.concatenate(row_parts)
+    blocks, columns = [], {}
+    try:
+        for column, spec in column_specs.items():
+            block, array = attach_array(spec)
+            blocks.append(block)
+            columns[column] = array[rows]
+            del array
+    finally:
+        for block in blocks:
+            block.close()
+
+    food_nutrient_df = pd.DataFrame({"FOOD_RECORD_ID": columns['fdc_id'], "NUTRIENT_ID": columns['nutrient_id'], "NUTRIENT_QUANTITY": columns['amount']})
+    return food_nutrient_df.groupby(["FOOD_RECORD_ID", "NUTRIENT_ID"], as_index=False)["NUTRIENT_QUANTITY"].mean()
+
+def parallel_clean_branded_food(branded_food_df: pd.DataFrame, executor: ProcessPoolExecutor | None, shards: int) -> pd.DataFrame:
+    if executor is None:
+        return clean_branded_food(branded_food_df)
+    df_filtered = select_latest_branded_food(branded_food_df)
+    bounds = get_shard_bounds(df_filtered['FOOD_RECORD_ID'], shards)
+    cleaned_branded_food_df = pd.concat(executor.map(normalize_branded_food, split_by_record_range(df_filtered, bounds)))
+    # Shards find different sets of units, and concatenating categoricals with different categories falls back to object.
+    return cleaned_branded_food_df.astype({'SERVING_SIZE_UNIT': 'category'})
+
+def parallel_clean_food(food_df: pd.DataFrame, cleaned_branded_food_df: pd.DataFrame, executor: ProcessPoolExecutor | None, bounds: np.ndarray) -> pd.DataFrame:
+    if executor is None:
+        return clean_food(food_df, cleaned_branded_food_df)
+    food_df = food_df.rename(columns={'fdc_id': 'FOOD_RECORD_ID', 'description': 'FOOD_NAME'})
+    food_df = food_df[food_df['FOOD_RECORD_ID'].isin(cleaned_branded_food_df['FOOD_RECORD_ID'])][['FOOD_RECORD_ID', 'FOOD_NAME']]
+    return pd.concat(executor.map(normalize_food_names, split_by_record_range(food_df, bounds)))
+
+def parallel_clean_food_nutrient(cleaned_branded_food_df: pd.DataFrame, food_nutrient_df: pd.DataFrame, executor: ProcessPoolExecutor | None, bounds: np.ndarray) -> pd.DataFrame:
+    if executor is None or cleaned_branded_food_df.empty:
+        return clean_food_nutrient(cleaned_branded_food_df, food_nutrient_df)
+
+    blocks = []
+    try:
+        column_specs = {}
+        for column, dtype in FOOD_NUTRIENT_COLUMNS.items():
+            block, column_specs[column] = share_array(np.ascontiguousarray(food_nutrient_df[column].to_numpy(dtype=dtype)))
+            blocks.append(block)
+        block, record_ids_spec = share_array(np.sort(cleaned_branded_food_df['FOOD_RECORD_ID'].unique()).astype('int64'))
+        blocks.append(block)
+
+        row_chunk_size = -(-len(food_nutrient_df) // (len(bounds) or 1)) or 1
+        row_ranges = [(start, min(start + row_chunk_size, len(food_nutrient_df))) for start in range(0, len(food_nutrient_df), row_chunk_size)]
+        chunk_parts = list(executor.map(partition_food_nutrient_rows, repeat(column_specs['fdc_id']), repeat(record_ids_spec), repeat(bounds),
+                                        *zip(*row_ranges))) if row_ranges else []
+        shard_rows = [[parts[shard] for parts in chunk_parts] or [np.empty(0, dtype='int64')] for shard in range(len(bounds))]
+        aggregated_df = pd.concat(executor.map(aggregate_food_nutrient_shard, repeat(column_specs), shard_rows), ignore_index=True)
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+    return to_nutrient_store(aggregated_df)
+
+def transform_record_shard(cleaned_branded_food_df: pd.DataFrame, cleaned_food_df: pd.DataFrame, cleaned_food_nutrient_df: pd.DataFrame, nutrient_names: pd.Series) -> pd.DataFrame:
+    return transform_cleaned_data(cleaned_branded_food_df, cleaned_food_df, None, cleaned_food_nutrient_df, nutrient_names)
+
+def parallel_transform_cleaned_data(cleaned_branded_food_df: pd.DataFrame, cleaned_food_df: pd.DataFrame, cleaned_nutrient_df: pd.DataFrame, cleaned_food_nutrient_df: pd.DataFrame,
+                                    executor: ProcessPoolExecutor | None, bounds: np.ndarray, profiler: StageProfiler | None = None) -> pd.DataFrame:
+    if executor is None:
+        return transform_cleaned_data(cleaned_branded_food_df, cleaned_food_df, cleaned_nutrient_df, cleaned_food_nutrient_df, profiler=profiler)
+
+    # The merge, thresholds and widening run together inside each worker, so they are profiled as one stage.
+    profiler = profiler or StageProfiler()
+    with profiler.stage('transform_cleaned_data (workers)', len(cleaned_branded_food_df)) as stage:
+        # Every shard keeps the global nutrient categories, so the wide shards share one column layout and concatenate in record order.
+        nutrient_names = map_nutrient_names_to_nutrient_ids(cleaned_nutrient_df, cleaned_food_nutrient_df)
+        shards = zip(*(split_by_record_range(df, bounds) for df in (cleaned_branded_food_df, cleaned_food_df, cleaned_food_nutrient_df)))
+        final_data = pd.concat(executor.map(transform_record_shard, *zip(*shards), repeat(nutrient_names)), ignore_index=True)
+        stage['rows_out'] = len(final_data)
+    return final_data
+
+def transform_food_tables(branded_food_df: pd.DataFrame, food_df: pd.DataFrame, nutrient_df: pd.DataFrame, food_nutrient_df: pd.DataFrame,
+                          executor: ProcessPoolExecutor | None, shards: int) -> pd.DataFrame:
+    cleaned_branded_food_df = parallel_clean_branded_food(branded_food_df, executor, shards)
+    bounds = get_shard_bounds(cleaned_branded_food_df['FOOD_RECORD_ID'], shards)
+    cleaned_food_df = parallel_clean_food(food_df, cleaned_branded_food_df, executor, bounds)
+    cleaned_nutrient_df = clean_nutrient(nutrient_df)
+    cleaned_food_nutrient_df = parallel_clean_food_nutrient(cleaned_branded_food_df, food_nutrient_df, executor, bounds)
+    return parallel_transform_cleaned_data(cleaned_branded_food_df, cleaned_food_df, cleaned_nutrient_df, cleaned_food_nutrient_df, executor, bounds)
+
+def process_release(zip_ref: zipfile.ZipFile, release: str, state: dict | None, stream: bool, max_memory_mb: int, incremental: bool, workers: int,
+                    profiler: StageProfiler | None = None) -> None:
+    profiler = profiler or StageProfiler()
+    members = find_zip_members(zip_ref, TARGET_FILES)
+    if not members:
+        return
+
+    previous_release = state['release'] if state else None
+    with profiler.stage('read_csvs') as stage:
+        branded_food_df = read_zip_csv(zip_ref, members["branded_food.csv"])
+        food_df = read_zip_csv(zip_ref, members["food.csv"])
+        nutrient_df = read_zip_csv(zip_ref, members["nutrient.csv"])
+        food_nutrient_df = None if stream else read_zip_csv(zip_ref, members["food_nutrient.csv"])
+        stage['rows_out'] = len(branded_food_df) + len(food_df) + len(nutrient_df) + (0 if stream else len(food_nutrient_df))
+    chunk_size = food_nutrient_chunk_size(max_memory_mb)
+
+    with create_transform_executor(workers) as executor:
+        shards = workers * SHARDS_PER_WORKER
+        with profiler.stage('clean_branded_food', len(branded_food_df)) as stage:
+            cleaned_branded_food_df = parallel_clean_branded_food(branded_food_df, executor, shards)
+            bounds = get_shard_bounds(cleaned_branded_food_df['FOOD_RECORD_ID'], shards)
+            stage['rows_out'] = len(cleaned_branded_food_df)
+        with profiler.stage('clean_food', len(food_df)) as stage:
+            cleaned_food_df = parallel_clean_food(food_df, cleaned_branded_food_df, executor, bounds)
+            stage['rows_out'] = len(cleaned_food_df)
+        with profiler.stage('clean_nutrient', len(nutrient_df)) as stage:
+            cleaned_nutrient_df = clean_nutrient(nutrient_df)
+            stage['rows_out'] = len(cleaned_nutrient_df)
+
+        if incremental:
+            with profiler.stage('hash_food_records', len(cleaned_branded_food_df)) as stage:
+                food_nutrient_chunks = read_food_nutrient_chunks(zip_ref, members["food_nutrient.csv"], chunk_size) if stream else [food_nutrient_df]
+                transform_hash = hash_transform_inputs(cleaned_nutrient_df)
+                record_hashes = hash_food_records(cleaned_branded_food_df, cleaned_food_df, food_nutrient_chunks)
+                changed_ids, removed_ids = diff_food_records(state, transform_hash, record_hashes)
+                patch_existing = state is not None and len(changed_ids) < len(record_hashes)
+
+                cleaned_branded_food_df = cleaned_branded_food_df[cleaned_branded_food_df['FOOD_RECORD_ID'].isin(changed_ids)]
+                cleaned_food_df = cleaned_food_df[cleaned_food_df['FOOD_RECORD_ID'].isin(changed_ids)]
+                stage['rows_out'] = len(changed_ids)
+            print(f"{release}: {len(changed_ids)} new or changed records, {len(removed_ids)} removed since {previous_release}.")
+
+        # Streamed rows are only counted as they are read, so the stream reports rows out only.
+        with profiler.stage('clean_food_nutrient', None if stream else len(food_nutrient_df)) as stage:
+            if stream:
+                food_nutrient_chunks = read_food_nutrient_chunks(zip_ref, members["food_nutrient.csv"], chunk_size)
+                cleaned_food_nutrient_df = stream_clean_food_nutrient(cleaned_branded_food_df, food_nutrient_chunks, chunk_size)
+            else:
+                cleaned_food_nutrient_df = parallel_clean_food_nutrient(cleaned_branded_food_df, food_nutrient_df, executor, bounds)
+            stage['rows_out'] = len(cleaned_food_nutrient_df)
+
+        final_data = parallel_transform_cleaned_data(cleaned_branded_food_df, cleaned_food_df, cleaned_nutrient_df, cleaned_food_nutrient_df,
+                                                     executor, bounds, profiler)
+        upserted_ids = final_data['FOOD_RECORD_ID']
+
+    if incremental and patch_existing:
+        with profiler.stage('patch_final_data', len(final_data)) as stage:
+            final_data = patch_final_data(OUTPUT_PATH, final_data, changed_ids.union(removed_ids))
+            stage['rows_out'] = len(final_data)
+
+    with profiler.stage('write_csv', len(final_data)) as stage:
+        final_data.to_csv(OUTPUT_PATH, index=False, quoting=csv.QUOTE_NONNUMERIC)
+        stage['rows_out'] = len(final_data)
+    with profiler.stage('write_parquet_dataset', len(final_data)) as stage:
+        write_parquet_dataset(final_data, PARQUET_PATH)
+        stage['rows_out'] = len(final_data)
+    with profiler.stage('write_analytics', len(final_data)) as stage:
+        write_analytics(final_data, ANALYTICS_PATH, release)
+        stage['rows_out'] = len(final_data)
+
+    if incremental:
+        deleted_ids = removed_ids.union(changed_ids.difference(upserted_ids.astype('int64'))).astype(str) if state else []
+        write_changes_manifest(CHANGES_PATH, release, previous_release, upserted_ids, deleted_ids)
+        save_pipeline_state(STATE_PATH, release, transform_hash, record_hashes)
+
+def execute_pipeline(stream: bool = False, max_memory_mb: int = DEFAULT_MAX_MEMORY_MB, incremental: bool = False,
+                     download_link: str | None = None, download_workers: int = DOWNLOAD_WORKERS, expected_sha256: str | None = None,
+                     workers: int = DEFAULT_WORKERS, input_zip: str | None = None, profile_report: str | None = None) -> None:
+    download_link = input_zip or download_link or find_usda_food_data_link()
+    if not download_link:
+        print("CSV link not found.")
+        return
+
+    release = get_release_name(download_link)
+    state = load_pipeline_state(STATE_PATH) if incremental and os.path.exists(OUTPUT_PATH) else None
+    previous_release = state['release'] if state else None
+    if state is not None and previous_release == release:
+        # The manifest from the run that processed this release is left alone, in case it has not been uploaded yet.
+        print(f"{release} has already been processed, nothing to update.")
+        return
+
+    profiler = StageProfiler()
+    if input_zip:
+        zip_file_path = input_zip
+    else:
+        with profiler.stage('download') as stage:
+            zip_file_path = download_usda_food_data(download_link, download_workers, expected_sha256)
+        if not zip_file_path:
+            return
+
+    with zipfile.ZipFile(zip_file_path) as zip_ref:
+        process_release(zip_ref, release, state, stream, max_memory_mb, incremental, workers, profiler)
+    if not input_zip:
+        cleanup([zip_file_path])
+
+    if profile_report:
+        profiler.write_report(profile_report, release=release, stream=stream, max_memory_mb=max_memory_mb, incremental=incremental, workers=workers)
+        profiler.print_summary()
+        print(f"Stage profile written to {profile_report}.")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build usda_branded_food_data.csv from the latest FoodData Central release.")
+    parser.add_argument("--stream", action="store_true",
+                        help="Read food_nutrient.csv in chunks so peak memory follows the output size instead of the input size.")
+    parser.add_argument("--max-memory-mb", type=int, default=None,
+                        help=f"Memory budget for the food_nutrient.csv stream in MB (implies --stream, default {DEFAULT_MAX_MEMORY_MB}).")
+    parser.add_argument("--incremental", action="store_true",
+                        help=f"Only reprocess records that changed since the release recorded in {STATE_PATH}, patch {OUTPUT_PATH} "
+                             f"in place and list the touched FOOD_RECORD_IDs in {CHANGES_PATH}.")
+    parser.add_argument("--download-url", default=None,
+                        help="FoodData Central CSV zip to process instead of discovering the latest one on the download page.")
+    parser.add_argument("--download-workers", type=int, default=DOWNLOAD_WORKERS,
+                        help=f"Number of parallel HTTP range requests used to fetch the zip (default {DOWNLOAD_WORKERS}).")
+    parser.add_argument("--sha256", default=None, help="Expected SHA-256 of the zip, checked before extraction.")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help="Number of processes for the cleaning and transform stages, split by FOOD_RECORD_ID ranges (default 1, serial).")
+    parser.add_argument("--input-zip", default=None,
+                        help="Process a local FoodData Central CSV zip (e.g. from utils/generate_synthetic_fdc_data.py) instead of downloading one.")
+    parser.add_argument("--profile-report", default=None,
+                        help="Write per-stage wall time, CPU time, peak RSS and row counts to this JSON file.")
+    args = parser.parse_args()
+
+    execute_pipeline(
+        stream=args.stream or args.max_memory_mb is not None,
+        max_memory_mb=args.max_memory_mb or DEFAULT_MAX_MEMORY_MB,
+        incremental=args.incremental,
+        download_link=args.download_url,
+        download_workers=args.download_workers,
+        expected_sha256=args.sha256,
+        workers=args.workers,
+        input_zip=args.input_zip,
+        profile_report=args.profile_report,
+    )
@@ -0,0 +1,41 @@
+import os
+import sys
+import time
+import hashlib
+import argparse
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from usda_branded_food_data_pipeline import SHARDS_PER_WORKER, create_transform_executor, transform_food_tables
+from generate_synthetic_fdc_data import generate_fdc_tables
+
+def run_transform(tables: dict[str, pd.DataFrame], workers: int) -> tuple[float, str]:
+    start = time.perf_counter()
+    with create_transform_executor(workers) as executor:
+        final_data = transform_food_tables(tables['branded_food'], tables['food'], tables['nutrient'], tables['food_nutrient'],
+                                           executor, workers * SHARDS_PER_WORKER)
+    elapsed = time.perf_counter() - start
+    return elapsed, hashlib.sha256(final_data.to_csv(index=False).encode()).hexdigest()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure how the cleaning and transform stages scale with --workers on synthetic FDC tables.")
+    parser.add_argument("--records", type=int, default=200_000)
+    parser.add_argument("--nutrients-per-record", type=int, default=15)
+    parser.add_argument("--workers", type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    tables = generate_fdc_tables(args.records, args.nutrients_per_record)
+    print(f"{args.records} records, {len(tables['food_nutrient'])} food_nutrient rows, best of {args.repeats} runs")
+    print(f"{'workers':>8} {'seconds':>10} {'speedup':>8}  output")
+
+    baseline_seconds, baseline_digest = None, None
+    for workers in args.workers:
+        results = [run_transform(tables, workers) for _ in range(args.repeats)]
+        seconds = min(elapsed for elapsed, _ in results)
+        digest = results[0][1]
+        if baseline_seconds is None:
+            baseline_seconds, baseline_digest = seconds, digest
+        status = "identical" if digest == baseline_digest else "DIFFERS"
+        print(f"{workers:>8} {seconds:>10.2f} {baseline_seconds / seconds:>7.2f}x  {status}")
@@ -0,0 +1,84 @@
+import os
+import sys
+import json
+import argparse
+import tempfile
+import subprocess
+
+from generate_synthetic_fdc_data import generate_fdc_tables, write_fdc_zip
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PIPELINE_SCRIPT = os.path.join(REPO_ROOT, "usda_branded_food_data_pipeline.py")
+CONFIGURATIONS: dict[str, list[str]] = {
+    'serial': [],
+    'stream': ['--stream'],
+    'workers-4': ['--workers', '4'],
+}
+
+def run_configuration(name: str, flags: list[str], zip_path: str, work_dir: str) -> dict:
+    # Each run gets its own process, so peak RSS is not inherited from earlier runs, and its own directory for the outputs.
+    run_dir = os.path.join(work_dir, name)
+    os.makedirs(run_dir, exist_ok=True)
+    report_path = os.path.join(run_dir, "profile.json")
+    subprocess.run([sys.executable, PIPELINE_SCRIPT, '--input-zip', zip_path, '--profile-report', report_path, *flags],
+                   cwd=run_dir, check=True, stdout=subprocess.DEVNULL)
+    with open(report_path) as file:
+        return json.load(file)
+
+def find_regressions(results: dict[str, dict], baseline: dict[str, dict], tolerance: float, min_seconds: float) -> list[str]:
+    regressions = []
+    for name, report in results.items():
+        baseline_stages = {stage['stage']: stage for stage in baseline.get(name, {}).get('stages', [])}
+        for stage in report['stages']:
+            previous = baseline_stages.get(stage['stage'])
+            if previous is None:
+                continue
+            for metric in ('wall_seconds', 'peak_rss_mb'):
+                before, after = previous.get(metric), stage.get(metric)
+                # Sub-threshold timings are dominated by noise, so only stages that take real time are compared.
+                if not before or after is None or (metric == 'wall_seconds' and before < min_seconds):
+                    continue
+                if after > before * (1 + tolerance):
+                    regressions.append(f"{name}/{stage['stage']}: {metric} {before} -> {after} (+{(after / before - 1) * 100:.0f}%)")
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Profile the pipeline stage by stage on a synthetic FoodData Central release.")
+    parser.add_argument("--records", type=int, default=200_000)
+    parser.add_argument("--nutrients-per-record", type=int, default=15)
+    parser.add_argument("--configurations", nargs='+', choices=list(CONFIGURATIONS), default=list(CONFIGURATIONS))
+    parser.add_argument("--output", default="benchmark_report.json")
+    parser.add_argument("--baseline", default=None, help="Earlier --output report; exits non-zero if a stage got slower or larger.")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative increase over the baseline (default 0.2).")
+    parser.add_argument("--min-seconds", type=float, default=0.5, help="Ignore wall-time changes in stages faster than this in the baseline.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        zip_path = os.path.join(work_dir, "FoodData_Central_csv_synthetic.zip")
+        tables = generate_fdc_tables(args.records, args.nutrients_per_record)
+        write_fdc_zip(tables, zip_path)
+        del tables
+
+        results = {}
+        for name in args.configurations:
+            results[name] = run_configuration(name, CONFIGURATIONS[name], zip_path, work_dir)
+            print(f"\n{name}: {results[name]['wall_seconds']:.2f} s, peak {results[name]['peak_rss_mb']} MB")
+            for stage in results[name]['stages']:
+                print(f"  {stage['stage']:<36} {stage['wall_seconds']:>8.2f} s {stage['cpu_seconds']:>8.2f} cpu s "
+                      f"{stage['peak_rss_mb'] or 0:>8.0f} MB  {stage['rows_in'] if stage['rows_in'] is not None else '-'} -> {stage['rows_out']}")
+
+    with open(args.output, 'w') as file:
+        json.dump({'records': args.records, 'nutrients_per_record': args.nutrients_per_record, 'results': results}, file, indent=2)
+    print(f"\nReport written to {args.output}.")
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        if baseline.get('records') != args.records or baseline.get('nutrients_per_record') != args.nutrients_per_record:
+            print("Baseline was recorded at a different scale; comparing anyway.")
+        regressions = find_regressions(results, baseline['results'], args.tolerance, args.min_seconds)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print("No regressions against the baseline.")
@@ -1,6 +1,15 @@
-import pandas as pd
+import os
+import pyarrow.dataset as ds
+from load_food_data import load_food_data
+from query_food_analytics import ANALYTICS_PATH, FoodAnalytics
 
-df = pd.read_csv('usda_branded_food_data.csv', low_memory=False, dtype={'FOOD_RECORD_ID': str})
-df['nan_count'] = df.isna().sum(axis=1)
-top_10_least_nan = df.nsmallest(10, 'nan_count').drop(columns=['nan_count'])
-top_10_least_nan.to_csv('top_10_least_nan_records.csv', index=False)
\ No newline at end of file
+if os.path.isdir(ANALYTICS_PATH):
+    # The populated-nutrient counts are precomputed, so only the ten selected rows are read from the dataset.
+    record_ids = FoodAnalytics().most_populated(10)['FOOD_RECORD_ID'].tolist()
+    df = load_food_data(filter=ds.field('FOOD_RECORD_ID').isin(record_ids), restore_decimals=True)
+    top_10_least_nan = df.set_index('FOOD_RECORD_ID').loc[record_ids].reset_index()
+else:
+    df = load_food_data()
+    df['nan_count'] = df.isna().sum(axis=1)
+    top_10_least_nan = df.nsmallest(10, 'nan_count').drop(columns=['nan_count'])
+top_10_least_nan.to_csv('top_10_least_nan_records.csv', index=False)
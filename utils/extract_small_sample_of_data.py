@@ -1,9 +1,9 @@
-# scipt which reads the full processed dataset, and extracts a small 100,000 row sample and exports it to a new file
+# script which streams the processed dataset, draws a reproducible 100,000 row sample and exports it as Parquet shards and a CSV
 
-import pandas as pd
+from load_food_data import iter_food_batches
+from sample_food_data import sample_food_data, write_shards
 
-df = pd.read_csv("usda_branded_food_data.csv", low_memory=False)
+sample, _ = sample_food_data(iter_food_batches(), size=100000, seed=42)
 
-sample_df = df.sample(n=100000, random_state=42)
-
-sample_df.to_csv("usda_branded_food_data_small_sample.csv", index=False)
\ No newline at end of file
+write_shards(sample.to_batches(), "usda_branded_food_data_small_sample")
+sample.to_pandas().to_csv("usda_branded_food_data_small_sample.csv", index=False)
@@ -0,0 +1,66 @@
+import os
+import zipfile
+import argparse
+import numpy as np
+import pandas as pd
+
+NUTRIENT_UNITS = ['G', 'MG', 'UG', 'KCAL', 'KJ', 'IU']
+SERVING_SIZE_UNITS = ['g', 'ml', 'GRM', 'MLT', 'IU', 'oz']
+INGREDIENT_WORDS = ['sugar', 'salt', 'wheat flour', 'water', 'palm oil', 'soy lecithin', 'natural flavor', 'milk', 'cocoa', 'corn syrup']
+
+def generate_fdc_tables(records: int, nutrients_per_record: int, seed: int = 42) -> dict[str, pd.DataFrame]:
+    rng = np.random.default_rng(seed)
+    fdc_ids = np.arange(1_000_000, 1_000_000 + records)
+    gtins = rng.integers(0, int(records * 0.9) or 1, records)
+
+    ingredients = np.array([', '.join(rng.choice(INGREDIENT_WORDS, 6)) for _ in range(256)], dtype=object)
+    branded_food_df = pd.DataFrame({
+        'fdc_id': fdc_ids,
+        'brand_owner': 'SYNTHETIC FOODS INC.',
+        'gtin_upc': [f"{gtin:012d}" for gtin in gtins],
+        'ingredients': np.where(rng.random(records) < 0.03, None, ingredients[rng.integers(0, len(ingredients), records)]),
+        'serving_size': np.round(rng.random(records) * 250, 3),
+        'serving_size_unit': np.array(SERVING_SIZE_UNITS, dtype=object)[rng.integers(0, len(SERVING_SIZE_UNITS), records)],
+    })
+    food_df = pd.DataFrame({
+        'fdc_id': fdc_ids,
+        'data_type': 'branded_food',
+        'description': [f" synthetic food {fdc_id} " for fdc_id in fdc_ids],
+    })
+
+    nutrient_ids = np.arange(1001, 1201)
+    nutrient_df = pd.DataFrame({
+        'id': nutrient_ids,
+        'name': [f"Nutrient {nutrient_id}" for nutrient_id in nutrient_ids],
+        'unit_name': np.array(NUTRIENT_UNITS)[nutrient_ids % len(NUTRIENT_UNITS)],
+    })
+
+    rows = records * nutrients_per_record
+    food_nutrient_df = pd.DataFrame({
+        'id': np.arange(rows),
+        'fdc_id': rng.choice(fdc_ids, rows),
+        'nutrient_id': rng.choice(nutrient_ids, rows, p=np.linspace(2, 0.01, len(nutrient_ids)) / np.linspace(2, 0.01, len(nutrient_ids)).sum()),
+        'amount': np.round(rng.random(rows) ** 4 * 1000, 3),
+    })
+    return {'branded_food': branded_food_df, 'food': food_df, 'nutrient': nutrient_df, 'food_nutrient': food_nutrient_df}
+
+def write_fdc_zip(tables: dict[str, pd.DataFrame], zip_path: str) -> None:
+    # Same layout as the FoodData Central download: one release folder holding the CSVs.
+    release = os.path.splitext(os.path.basename(zip_path))[0]
+    os.makedirs(os.path.dirname(os.path.abspath(zip_path)), exist_ok=True)
+    with zipfile.ZipFile(zip_path, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=1) as zip_ref:
+        for name, df in tables.items():
+            with zip_ref.open(f"{release}/{name}.csv", 'w', force_zip64=True) as file:
+                df.to_csv(file, index=False)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write a synthetic FoodData Central CSV zip for running and benchmarking the pipeline offline.")
+    parser.add_argument("--records", type=int, default=200_000)
+    parser.add_argument("--nutrients-per-record", type=int, default=15)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default="FoodData_Central_csv_synthetic.zip")
+    args = parser.parse_args()
+
+    tables = generate_fdc_tables(args.records, args.nutrients_per_record, args.seed)
+    write_fdc_zip(tables, args.output)
+    print(f"Wrote {args.records} branded foods and {len(tables['food_nutrient'])} food_nutrient rows to {args.output}.")
@@ -0,0 +1,57 @@
+import os
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+from collections.abc import Iterator
+
+CSV_PATH = 'usda_branded_food_data.csv'
+PARQUET_PATH = 'usda_branded_food_data_parquet'
+FIXED_COLUMNS = ['FOOD_RECORD_ID', 'FOOD_ID', 'FOOD_NAME', 'FOOD_SERVING_SIZE', 'FOOD_INGREDIENTS']
+BATCH_ROWS = 65_536
+
+def open_food_dataset(parquet_path: str = PARQUET_PATH) -> ds.Dataset:
+    return ds.dataset(parquet_path, format='parquet')
+
+def restore_nutrient_decimals(df: pd.DataFrame) -> pd.DataFrame:
+    # The pipeline stores a nutrient as float32 only when rounding the float64 cast to 2 decimals gives back the CSV
+    # values exactly, and as float64 (left as is here) when it holds values too large for that.
+    float32_columns = df.select_dtypes(include='float32').columns
+    return df.astype({column: 'float64' for column in float32_columns}).round({column: 2 for column in float32_columns})
+
+def load_food_data(columns: list[str] | None = None, filter: ds.Expression | None = None, restore_decimals: bool = False,
+                   parquet_path: str = PARQUET_PATH, csv_path: str = CSV_PATH) -> pd.DataFrame:
+    if os.path.isdir(parquet_path):
+        df = open_food_dataset(parquet_path).to_table(columns=columns, filter=filter).to_pandas()
+        return restore_nutrient_decimals(df) if restore_decimals else df
+
+    if filter is not None:
+        raise FileNotFoundError(f"{parquet_path} is required to load filtered food data.")
+    return pd.read_csv(csv_path, low_memory=False, dtype={'FOOD_RECORD_ID': str}, usecols=columns)
+
+def prepare_batch(batch: pa.RecordBatch, restore_decimals: bool) -> pa.RecordBatch:
+    # Dictionary-encoded text is decoded, so batches from different files share one schema and concatenate freely.
+    # Nutrients are restored like restore_nutrient_decimals when requested.
+    columns, fields = [], []
+    for field, column in zip(batch.schema, batch.columns):
+        if pa.types.is_dictionary(field.type):
+            column = column.cast(field.type.value_type)
+        elif restore_decimals and pa.types.is_float32(field.type):
+            column = pc.round(column.cast(pa.float64()), 2)
+        columns.append(column)
+        fields.append(pa.field(field.name, column.type))
+    return pa.RecordBatch.from_arrays(columns, schema=pa.schema(fields))
+
+def iter_food_batches(columns: list[str] | None = None, batch_rows: int = BATCH_ROWS, restore_decimals: bool = False,
+                      parquet_path: str = PARQUET_PATH, csv_path: str = CSV_PATH) -> Iterator[pa.RecordBatch]:
+    # Streams the food data in record order without materializing it, so memory stays at one batch whatever the row count.
+    if os.path.isdir(parquet_path):
+        # Readahead is kept to one batch, since the default prefetches many batches across several files.
+        batches = open_food_dataset(parquet_path).to_batches(columns=columns, batch_size=batch_rows, batch_readahead=1, fragment_readahead=1)
+    else:
+        # Text IDs are read as strings in every chunk, so each chunk infers the same schema.
+        chunks = pd.read_csv(csv_path, low_memory=False, dtype={'FOOD_RECORD_ID': str, 'FOOD_ID': str}, usecols=columns, chunksize=batch_rows)
+        batches = (pa.RecordBatch.from_pandas(chunk, preserve_index=False) for chunk in chunks)
+    for batch in batches:
+        if batch.num_rows:
+            yield prepare_batch(batch, restore_decimals)
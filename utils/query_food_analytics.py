@@ -0,0 +1,159 @@
+import os
+import json
+import time
+import argparse
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+ANALYTICS_PATH = 'usda_branded_food_data_analytics'
+
+class FoodAnalytics:
+    # Answers top-k, range and group-average queries from the artifacts the pipeline writes next to the CSV.
+    # Arrays are memory-mapped, so a query only pages in the nutrient columns and rows it reads.
+    def __init__(self, analytics_path: str = ANALYTICS_PATH):
+        if not os.path.isdir(analytics_path):
+            raise FileNotFoundError(f"{analytics_path} not found; run usda_branded_food_data_pipeline.py to build it.")
+        with open(os.path.join(analytics_path, "summary.json")) as file:
+            self.summary = json.load(file)
+        self.nutrients = [nutrient['name'] for nutrient in self.summary['nutrients']]
+        self.nutrient_ids = {name: column_id for column_id, name in enumerate(self.nutrients)}
+
+        def load(name):
+            return np.load(os.path.join(analytics_path, f"{name}.npy"), mmap_mode='r')
+        self.values = load("nutrients")
+        self.populated_counts = load("populated_counts")
+        self.populated_bitmap = load("populated_bitmap")
+        self.sorted_offsets = load("sorted_offsets")
+        self.sorted_rows = load("sorted_rows")
+        self.sorted_values = load("sorted_values")
+        self.records = pa.ipc.open_file(pa.memory_map(os.path.join(analytics_path, "records.arrow"))).read_all()
+
+    def find_nutrient(self, query: str) -> str:
+        # Accepts the exact column name or any unambiguous part of it, e.g. "protein" for "PROTEIN (G)".
+        query = query.strip().upper()
+        if query in self.nutrient_ids:
+            return query
+        candidates = [name for name in self.nutrients if query in name]
+        starting = [name for name in candidates if name.startswith(query)]
+        if len(candidates) == 1 or len(starting) == 1:
+            return (starting or candidates)[0]
+        if not candidates:
+            raise KeyError(f"No nutrient matches {query!r}.")
+        raise KeyError(f"{query!r} matches {len(candidates)} nutrients: {', '.join(candidates[:10])}")
+
+    def nutrient_values(self, nutrient: str, rows: np.ndarray) -> np.ndarray:
+        # Values are float32 only when every nutrient survives that, rounded back to 2 decimals, and float64 otherwise.
+        return np.round(self.values[:, self.nutrient_ids[nutrient]][rows].astype('float64'), 2)
+
+    def records_at(self, rows: np.ndarray, **columns) -> pd.DataFrame:
+        df = self.records.take(pa.array(rows, type=pa.int64())).to_pandas()
+        return df.assign(**columns)
+
+    def get_segment(self, nutrient: str) -> tuple[np.ndarray, np.ndarray]:
+        column_id = self.nutrient_ids[nutrient]
+        start, end = self.sorted_offsets[column_id], self.sorted_offsets[column_id + 1]
+        return self.sorted_rows[start:end], self.sorted_values[start:end]
+
+    def top_k(self, nutrient: str, k: int = 10, ascending: bool = False) -> pd.DataFrame:
+        nutrient = self.find_nutrient(nutrient)
+        rows, _ = self.get_segment(nutrient)
+        rows = np.asarray(rows[:k] if ascending else rows[::-1][:k])
+        return self.records_at(rows, **{nutrient: self.nutrient_values(nutrient, rows)})
+
+    def range(self, nutrient: str, low: float | None = None, high: float | None = None, limit: int | None = None) -> tuple[int, pd.DataFrame]:
+        # Bounds are inclusive and results come in ascending value order. Bounds are cast to the stored dtype, so a
+        # float32 bound matches the float32 cast of the same 2-decimal value.
+        nutrient = self.find_nutrient(nutrient)
+        rows, values = self.get_segment(nutrient)
+        start = 0 if low is None else int(np.searchsorted(values, values.dtype.type(low), side='left'))
+        end = len(values) if high is None else max(int(np.searchsorted(values, values.dtype.type(high), side='right')), start)
+        rows = np.asarray(rows[start:end if limit is None else min(end, start + limit)])
+        return end - start, self.records_at(rows, **{nutrient: self.nutrient_values(nutrient, rows)})
+
+    def group_average(self, nutrient: str, group_by: str = 'FOOD_NAME', match: str | None = None, min_count: int = 1,
+                      limit: int | None = None) -> pd.DataFrame:
+        # Averages one nutrient per distinct value of a record column, e.g. the same product name across brands,
+        # over the records whose FOOD_NAME contains `match`. Records without a value for the nutrient are skipped.
+        nutrient = self.find_nutrient(nutrient)
+        if match:
+            matched = pc.fill_null(pc.match_substring(self.records['FOOD_NAME'], match.strip().upper()), False)
+            rows = np.flatnonzero(matched.to_numpy(zero_copy_only=False))
+        else:
+            rows = np.arange(self.records.num_rows)
+        values = self.nutrient_values(nutrient, rows)
+        present = ~np.isnan(values)
+        rows, values = rows[present], values[present]
+
+        codes, groups = pd.factorize(self.records[group_by].take(pa.array(rows, type=pa.int64())).to_numpy(zero_copy_only=False))
+        kept = codes >= 0
+        counts = np.bincount(codes[kept], minlength=len(groups))
+        sums = np.bincount(codes[kept], weights=values[kept], minlength=len(groups))
+        result = pd.DataFrame({group_by: groups, 'COUNT': counts, f"AVERAGE {nutrient}": np.round(sums / np.maximum(counts, 1), 2)})
+        result = result[result['COUNT'] >= min_count].sort_values(['COUNT', group_by], ascending=[False, True], ignore_index=True)
+        return result if limit is None else result.head(limit)
+
+    def most_populated(self, k: int = 10) -> pd.DataFrame:
+        # Stable, so ties keep CSV order like DataFrame.nsmallest on the missing-value count.
+        rows = np.argsort(-self.populated_counts.astype('int32'), kind='stable')[:k]
+        return self.records_at(rows, POPULATED_NUTRIENTS=np.asarray(self.populated_counts[rows]))
+
+    def populated_nutrients(self, row: int) -> list[str]:
+        bits = np.unpackbits(self.populated_bitmap[row], count=len(self.nutrients), bitorder='little')
+        return [self.nutrients[column_id] for column_id in np.flatnonzero(bits)]
+
+    def describe(self, nutrient: str) -> dict:
+        return self.summary['nutrients'][self.nutrient_ids[self.find_nutrient(nutrient)]]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Query the precomputed analytics written by the pipeline without loading the full CSV.")
+    parser.add_argument("--analytics", default=ANALYTICS_PATH)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    top = subparsers.add_parser("top", help="Foods with the highest (or --ascending lowest) value of a nutrient.")
+    top.add_argument("nutrient")
+    top.add_argument("-k", type=int, default=10)
+    top.add_argument("--ascending", action="store_true")
+
+    value_range = subparsers.add_parser("range", help="Foods whose nutrient value lies within inclusive bounds.")
+    value_range.add_argument("nutrient")
+    value_range.add_argument("--min", type=float, default=None)
+    value_range.add_argument("--max", type=float, default=None)
+    value_range.add_argument("--limit", type=int, default=20)
+
+    group_average = subparsers.add_parser("group-average", help="Average of a nutrient per distinct food name (or --group-by column).")
+    group_average.add_argument("nutrient")
+    group_average.add_argument("--match", default=None, help="Only foods whose name contains this text.")
+    group_average.add_argument("--group-by", default="FOOD_NAME", choices=["FOOD_NAME", "FOOD_ID", "FOOD_SERVING_SIZE"])
+    group_average.add_argument("--min-count", type=int, default=1)
+    group_average.add_argument("--limit", type=int, default=20)
+
+    most_populated = subparsers.add_parser("most-populated", help="Foods with the most populated nutrients.")
+    most_populated.add_argument("-k", type=int, default=10)
+
+    describe = subparsers.add_parser("describe", help="Count, min, max, mean and percentiles of a nutrient.")
+    describe.add_argument("nutrient")
+    args = parser.parse_args()
+
+    analytics = FoodAnalytics(args.analytics)
+    if hasattr(args, 'nutrient'):
+        try:
+            args.nutrient = analytics.find_nutrient(args.nutrient)
+        except KeyError as e:
+            parser.error(e.args[0])
+
+    start = time.perf_counter()
+    if args.command == "top":
+        print(analytics.top_k(args.nutrient, args.k, args.ascending).to_string(index=False))
+    elif args.command == "range":
+        count, df = analytics.range(args.nutrient, args.min, args.max, args.limit)
+        print(df.to_string(index=False))
+        print(f"{count} matching foods, showing {len(df)}.")
+    elif args.command == "group-average":
+        print(analytics.group_average(args.nutrient, args.group_by, args.match, args.min_count, args.limit).to_string(index=False))
+    elif args.command == "most-populated":
+        print(analytics.most_populated(args.k).to_string(index=False))
+    else:
+        print(json.dumps(analytics.describe(args.nutrient), indent=2))
+    print(f"Answered in {(time.perf_counter() - start) * 1000:.1f} ms.")
@@ -0,0 +1,162 @@
+import os
+import time
+import argparse
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from collections import Counter
+from collections.abc import Iterable
+from load_food_data import BATCH_ROWS, FIXED_COLUMNS, iter_food_batches
+
+DEFAULT_SAMPLE_SIZE = 100_000
+DEFAULT_SEED = 42
+DEFAULT_SHARD_ROWS = 50_000
+COMPLETENESS_BIN_WIDTH = 10
+SHARD_FORMATS = ['parquet', 'arrow']
+
+def get_sample_keys(record_ids: pa.Array, seed: int) -> np.ndarray:
+    # A seeded hash of FOOD_RECORD_ID, rather than a random draw per row, so the sample does not depend on batch size
+    # or file layout, and a record that survives into the next release stays in the sample.
+    return pd.util.hash_array(record_ids.to_numpy(zero_copy_only=False).astype(object), hash_key=f"{seed:016d}"[-16:])
+
+def get_serving_size_units(batch: pa.RecordBatch) -> np.ndarray:
+    # FOOD_SERVING_SIZE is "<size> <UNIT>", e.g. "30.0 G".
+    return pc.replace_substring_regex(batch.column('FOOD_SERVING_SIZE'), r'^.* ', '').to_numpy(zero_copy_only=False)
+
+def get_completeness_bins(batch: pa.RecordBatch) -> np.ndarray:
+    populated = sum(np.asarray(column.is_valid()) for name, column in zip(batch.schema.names, batch.columns) if name not in FIXED_COLUMNS)
+    # Each stratum is the lower bound of its band, e.g. 10 for 10-19 populated nutrients.
+    return populated // COMPLETENESS_BIN_WIDTH * COMPLETENESS_BIN_WIDTH
+
+STRATA = {
+    'unit': get_serving_size_units,
+    'completeness': get_completeness_bins,
+}
+
+class ReservoirSampler:
+    # Keeps the `size` records with the smallest sample keys, separately per stratum when stratify_by is given.
+    # That is a uniform sample without replacement, drawn in one pass with at most `size` rows held per stratum.
+    def __init__(self, size: int = DEFAULT_SAMPLE_SIZE, seed: int = DEFAULT_SEED, stratify_by: str | None = None):
+        self.size = size
+        self.seed = seed
+        self.get_strata = STRATA[stratify_by] if stratify_by else None
+        self.reservoirs = {}
+        self.seen = Counter()
+
+    def add(self, batch: pa.RecordBatch, offset: int) -> None:
+        keys = get_sample_keys(batch.column('FOOD_RECORD_ID'), self.seed)
+        positions = np.arange(offset, offset + batch.num_rows)
+        if self.get_strata is None:
+            self.seen[None] += batch.num_rows
+            self.merge(None, keys, positions, batch)
+            return
+
+        codes, strata = pd.factorize(self.get_strata(batch), use_na_sentinel=False)
+        for code, stratum in enumerate(strata):
+            rows = np.flatnonzero(codes == code)
+            self.seen[stratum] += len(rows)
+            self.merge(stratum, keys[rows], positions[rows], batch.take(pa.array(rows)))
+
+    def merge(self, stratum, keys: np.ndarray, positions: np.ndarray, batch: pa.RecordBatch) -> None:
+        current = self.reservoirs.get(stratum)
+        if current is not None:
+            current_keys, current_positions, current_table = current
+            if len(current_keys) >= self.size:
+                # Once the reservoir is full, only rows that beat its largest key can enter, and they get rarer as the pass goes on.
+                rows = np.flatnonzero(keys < current_keys.max())
+                keys, positions, batch = keys[rows], positions[rows], batch.take(pa.array(rows))
+            keys = np.concatenate([current_keys, keys])
+            positions = np.concatenate([current_positions, positions])
+            table = pa.concat_tables([current_table, pa.Table.from_batches([batch])])
+        else:
+            table = pa.Table.from_batches([batch])
+
+        if len(keys) > self.size:
+            kept = np.argpartition(keys, self.size - 1)[:self.size]
+            keys, positions, table = keys[kept], positions[kept], table.take(pa.array(kept))
+        self.reservoirs[stratum] = (keys, positions, table.combine_chunks())
+
+    def result(self) -> pa.Table | None:
+        # Rows come back in the order of the source data, i.e. sorted by FOOD_RECORD_ID.
+        if not self.reservoirs:
+            return None
+        positions = np.concatenate([positions for _, positions, _ in self.reservoirs.values()])
+        table = pa.concat_tables([table for _, _, table in self.reservoirs.values()])
+        return table.take(pa.array(np.argsort(positions, kind='stable')))
+
+    def stratum_counts(self) -> dict:
+        # Sampled and seen records per stratum; records without a stratum value (e.g. no serving size) sort last.
+        strata = sorted(self.seen, key=lambda stratum: (pd.isna(stratum), stratum if not pd.isna(stratum) else 0))
+        return {stratum: (len(self.reservoirs[stratum][0]), self.seen[stratum]) for stratum in strata}
+
+def sample_food_data(batches: Iterable[pa.RecordBatch], size: int = DEFAULT_SAMPLE_SIZE, seed: int = DEFAULT_SEED,
+                     stratify_by: str | None = None) -> tuple[pa.Table | None, dict]:
+    sampler = ReservoirSampler(size, seed, stratify_by)
+    offset = 0
+    for batch in batches:
+        sampler.add(batch, offset)
+        offset += batch.num_rows
+    return sampler.result(), sampler.stratum_counts()
+
+def write_shards(batches: Iterable[pa.RecordBatch], output_dir: str, shard_rows: int = DEFAULT_SHARD_ROWS, shard_format: str = 'parquet') -> list[str]:
+    # Writes part-NNNNN files of at most shard_rows rows each, holding one shard in memory at a time.
+    # Existing part files are removed first, so a smaller export does not leave stale shards behind.
+    os.makedirs(output_dir, exist_ok=True)
+    for name in os.listdir(output_dir):
+        if name.startswith('part-'):
+            os.remove(os.path.join(output_dir, name))
+
+    paths, pending, pending_rows = [], [], 0
+    def flush():
+        nonlocal pending, pending_rows
+        table = pa.Table.from_batches(pending)
+        path = os.path.join(output_dir, f"part-{len(paths):05d}.{shard_format}")
+        if shard_format == 'parquet':
+            pq.write_table(table, path, compression='zstd')
+        else:
+            with pa.OSFile(path, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        paths.append(path)
+        pending, pending_rows = [], 0
+
+    for batch in batches:
+        while batch.num_rows:
+            part = batch.slice(0, shard_rows - pending_rows)
+            pending.append(part)
+            pending_rows += part.num_rows
+            batch = batch.slice(part.num_rows)
+            if pending_rows == shard_rows:
+                flush()
+    if pending_rows:
+        flush()
+    return paths
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stream the processed food data into a seeded (optionally stratified) sample, "
+                                                 "or export all of it, as Parquet or Arrow shards.")
+    parser.add_argument("--output", default="usda_branded_food_data_sample")
+    parser.add_argument("--size", type=int, default=DEFAULT_SAMPLE_SIZE, help="Records in the sample, or per stratum with --stratify-by.")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--stratify-by", choices=list(STRATA), default=None,
+                        help=f"Sample up to --size records per serving-size unit, or per band of {COMPLETENESS_BIN_WIDTH} populated nutrients.")
+    parser.add_argument("--all", action="store_true", help="Export every record instead of sampling.")
+    parser.add_argument("--shard-rows", type=int, default=DEFAULT_SHARD_ROWS)
+    parser.add_argument("--format", choices=SHARD_FORMATS, default='parquet')
+    parser.add_argument("--restore-decimals", action="store_true", help="Write nutrients as float64 rounded to 2 decimals, as in the CSV.")
+    parser.add_argument("--batch-rows", type=int, default=BATCH_ROWS)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    batches = iter_food_batches(batch_rows=args.batch_rows, restore_decimals=args.restore_decimals)
+    if args.all:
+        paths = write_shards(batches, args.output, args.shard_rows, args.format)
+    else:
+        sample, counts = sample_food_data(batches, args.size, args.seed, args.stratify_by)
+        if args.stratify_by:
+            for stratum, (sampled, seen) in counts.items():
+                label = f"{stratum}-{stratum + COMPLETENESS_BIN_WIDTH - 1} nutrients" if args.stratify_by == 'completeness' else stratum
+                print(f"  {label!s:<16} {sampled:>9} of {seen}")
+        paths = write_shards(sample.to_batches(max_chunksize=args.shard_rows) if sample is not None else [], args.output, args.shard_rows, args.format)
+    print(f"Wrote {len(paths)} {args.format} shards to {args.output} in {time.perf_counter() - start:.1f} s.")
@@ -0,0 +1,216 @@
+import os
+import sys
+import random
+import hashlib
+import argparse
+import tempfile
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import usda_branded_food_data_pipeline as pipeline
+from generate_synthetic_fdc_data import generate_fdc_tables, write_fdc_zip
+
+CHECK_SEGMENT_BYTES = 1024 * 1024
+
+class DownloadFaults:
+    # Decides per GET whether to fail it with a 503 or cut the body short, and counts what was served.
+    # After fail_after_bytes body bytes every GET fails, like a connection that drops partway through a download.
+    def __init__(self, truncate_rate: float = 0.0, fail_rate: float = 0.0, fail_after_bytes: int | None = None,
+                 ranges: bool = True, seed: int = 42):
+        self.truncate_rate = truncate_rate
+        self.fail_rate = fail_rate
+        self.fail_after_bytes = fail_after_bytes
+        self.ranges = ranges
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = Counter()
+
+    def next_fault(self) -> str | None:
+        with self.lock:
+            if self.fail_after_bytes is not None and self.stats['bytes'] >= self.fail_after_bytes:
+                fault = 'failed'
+            else:
+                draw = self.random.random()
+                fault = 'failed' if draw < self.fail_rate else 'truncated' if draw < self.fail_rate + self.truncate_rate else None
+            self.stats[fault or 'served'] += 1
+            return fault
+
+    def record_bytes(self, count: int) -> None:
+        with self.lock:
+            self.stats['bytes'] += count
+
+class RangeRequestHandler(BaseHTTPRequestHandler):
+    # Serves the one file at /<file name> like a static file host: HEAD, GET, and single byte ranges answered with 206.
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def send_file_headers(self, status: int, length: int, content_range: str | None = None) -> None:
+        self.send_response(status)
+        self.send_header('Content-Length', str(length))
+        self.send_header('ETag', self.server.etag)
+        if self.server.faults.ranges:
+            self.send_header('Accept-Ranges', 'bytes')
+        if content_range:
+            self.send_header('Content-Range', content_range)
+        self.end_headers()
+
+    def find_file(self) -> bool:
+        if self.path.lstrip('/') != os.path.basename(self.server.filepath):
+            self.send_error(404)
+            return False
+        return True
+
+    def do_HEAD(self):
+        if self.find_file():
+            self.send_file_headers(200, self.server.size)
+
+    def do_GET(self):
+        if not self.find_file():
+            return
+        fault = self.server.faults.next_fault()
+        if fault == 'failed':
+            self.send_error(503)
+            return
+
+        size = self.server.size
+        start, end, status = 0, size - 1, 200
+        requested = self.headers.get('Range', '')
+        if self.server.faults.ranges and requested.startswith('bytes='):
+            first, last = requested[len('bytes='):].split('-')
+            start, end, status = int(first), min(int(last or size - 1), size - 1), 206
+        length = end - start + 1
+        # A truncated response still announces the full length, then closes the connection halfway through the body.
+        sent = length // 2 if fault == 'truncated' else length
+
+        self.send_file_headers(status, length, f"bytes {start}-{end}/{size}" if status == 206 else None)
+        with open(self.server.filepath, 'rb') as file:
+            file.seek(start)
+            self.wfile.write(file.read(sent))
+        self.server.faults.record_bytes(sent)
+        if sent < length:
+            self.close_connection = True
+
+def start_server(filepath: str, faults: DownloadFaults, port: int = 0, verbose: bool = False) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(('127.0.0.1', port), RangeRequestHandler)
+    server.filepath, server.size, server.faults, server.verbose = filepath, os.path.getsize(filepath), faults, verbose
+    server.etag = f'"{server.size:x}-{int(os.path.getmtime(filepath)):x}"'
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def get_sha256(filepath: str) -> str:
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as file:
+        for block in iter(lambda: file.read(pipeline.DOWNLOAD_BUFFER_BYTES), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def run_checks(zip_path: str, workers: int, segment_bytes: int = CHECK_SEGMENT_BYTES) -> list[str]:
+    # Runs download_usda_food_data against the local server, with segments small enough that the zip spans several,
+    # and returns the names of the checks that failed. Downloads land in a temporary working directory.
+    pipeline.DOWNLOAD_SEGMENT_BYTES = segment_bytes
+    size, sha256 = os.path.getsize(zip_path), get_sha256(zip_path)
+    failures = []
+
+    def check(name: str, passed: bool, detail: str) -> None:
+        print(f"  {'ok' if passed else 'FAIL':<4}  {name:<16} {detail}")
+        if not passed:
+            failures.append(name)
+
+    # One server for every check, since the resume state is keyed on the URL.
+    server = start_server(zip_path, DownloadFaults())
+    url = f"http://127.0.0.1:{server.server_port}/{os.path.basename(zip_path)}"
+
+    def download(faults: DownloadFaults, expected_sha256: str | None = sha256) -> str | None:
+        server.faults = faults
+        return pipeline.download_usda_food_data(url, workers, expected_sha256)
+
+    def downloaded_intact(filepath: str | None) -> bool:
+        return filepath is not None and get_sha256(filepath) == sha256 and not os.path.exists(f"{filepath}.download.json")
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as work_dir:
+        os.chdir(work_dir)
+        try:
+            faults = DownloadFaults()
+            filepath = download(faults)
+            check("clean", downloaded_intact(filepath) and faults.stats['bytes'] == size,
+                  f"{faults.stats['served']} range requests, {faults.stats['bytes']} of {size} bytes")
+            os.remove(filepath)
+
+            faults = DownloadFaults(truncate_rate=0.3)
+            filepath = download(faults)
+            check("truncated 206", downloaded_intact(filepath) and faults.stats['truncated'] > 0,
+                  f"{faults.stats['truncated']} truncated responses retried")
+            os.remove(filepath)
+
+            # The first attempt loses the connection halfway and gives up after one try per segment; the second resumes.
+            max_retries = pipeline.DOWNLOAD_MAX_RETRIES
+            pipeline.DOWNLOAD_MAX_RETRIES = 1
+            try:
+                download(DownloadFaults(fail_after_bytes=size // 2))
+                interrupted = False
+            except (pipeline.requests.RequestException, IOError):
+                interrupted = True
+            finally:
+                pipeline.DOWNLOAD_MAX_RETRIES = max_retries
+            faults = DownloadFaults()
+            filepath = download(faults)
+            check("resume", interrupted and downloaded_intact(filepath) and faults.stats['bytes'] < size,
+                  f"{faults.stats['bytes']} of {size} bytes fetched after the interruption")
+            os.remove(filepath)
+
+            faults = DownloadFaults()
+            filepath = download(faults, expected_sha256='0' * 64)
+            check("sha256 mismatch", filepath is None and not os.listdir(work_dir), "download rejected and removed")
+
+            faults = DownloadFaults(ranges=False)
+            filepath = download(faults)
+            check("no ranges", downloaded_intact(filepath) and faults.stats['served'] == 1, "fetched in one request")
+        finally:
+            os.chdir(cwd)
+            server.shutdown()
+            server.server_close()
+    return failures
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve a FoodData Central zip over local HTTP with byte ranges and injected faults, "
+                                                 "to exercise the pipeline's resumable, verified download offline.")
+    parser.add_argument("--zip", default="FoodData_Central_csv_synthetic.zip", help="Zip to serve; a synthetic release is written here if missing.")
+    parser.add_argument("--records", type=int, default=50_000, help="Branded foods in the synthetic release written when --zip is missing.")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--truncate-rate", type=float, default=0.0, help="Fraction of GETs whose body is cut off halfway.")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Fraction of GETs answered with HTTP 503.")
+    parser.add_argument("--fail-after-bytes", type=int, default=None, help="Answer every GET with HTTP 503 once this many body bytes were served.")
+    parser.add_argument("--no-ranges", action="store_true", help="Ignore Range headers and do not advertise Accept-Ranges.")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--check", action="store_true",
+                        help=f"Instead of serving, run the clean, truncated 206, resume, SHA-256 mismatch and no-ranges downloads "
+                             f"against the server with {CHECK_SEGMENT_BYTES // 1024} KiB segments, and exit non-zero on a failure.")
+    parser.add_argument("--download-workers", type=int, default=pipeline.DOWNLOAD_WORKERS)
+    args = parser.parse_args()
+
+    if not os.path.exists(args.zip):
+        write_fdc_zip(generate_fdc_tables(args.records, 15), args.zip)
+        print(f"Wrote a synthetic release with {args.records} branded foods to {args.zip}.")
+    zip_path = os.path.abspath(args.zip)
+
+    if args.check:
+        failures = run_checks(zip_path, args.download_workers)
+        sys.exit(f"{len(failures)} download checks failed: {', '.join(failures)}" if failures else 0)
+
+    faults = DownloadFaults(args.truncate_rate, args.fail_rate, args.fail_after_bytes, not args.no_ranges, args.seed)
+    server = start_server(zip_path, faults, args.port, verbose=True)
+    url = f"http://127.0.0.1:{server.server_port}/{os.path.basename(zip_path)}"
+    print(f"Serving {zip_path} ({server.size} bytes) at {url}")
+    print(f"python usda_branded_food_data_pipeline.py --download-url {url} --sha256 {get_sha256(zip_path)}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+    print(f"Served {dict(faults.stats)}.")
@@ -1,8 +1,12 @@
-import pandas as pd
 from datasets import Dataset
+from load_food_data import iter_food_batches
+from sample_food_data import write_shards
 
-df = pd.read_csv('usda_branded_food_data.csv', low_memory=False, dtype={'FOOD_RECORD_ID': str})
+EXPORT_PATH = "usda_branded_food_data_export"
 
-dataset = Dataset.from_pandas(df)
+# The shards are written batch by batch and Dataset.from_parquet memory-maps them, so the full table is never built in memory.
+paths = write_shards(iter_food_batches(restore_decimals=True), EXPORT_PATH)
 
-dataset.push_to_hub("usda_branded_food_data")
\ No newline at end of file
+dataset = Dataset.from_parquet(paths)
+
+dataset.push_to_hub("usda_branded_food_data")
@@ -1,85 +1,317 @@
-import pandas as pd
+import os
 import time
-from pinecone.grpc import PineconeGRPC as Pinecone
-from pinecone import ServerlessSpec
-
-pc = Pinecone()
-
-df = pd.read_csv('usda_branded_food_data.csv', low_memory=False, dtype={'FOOD_RECORD_ID': str})
+import json
+import uuid
+import hashlib
+import argparse
+import threading
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from load_food_data import load_food_data
 
-texts = []
-metadatas = []
+INDEX_NAME = "branded-food-data"
+EMBEDDING_MODEL = "multilingual-e5-large"
+EMBEDDING_DIMENSION = 1024
+# Pinecone Inference accepts at most 96 passages per embed call for multilingual-e5-large.
+MAX_BATCH_SIZE = 96
+MIN_BATCH_SIZE = 8
+BATCH_SIZE_STEP = 8
+# Attempts at a multi-record embed batch before it is split in half; single records get the full max_retries.
+SPLIT_AFTER_ATTEMPTS = 2
+METADATA_CHUNK_ROWS = 10_000
+PROGRESS_INTERVAL_SECONDS = 10
+CHECKPOINT_PATH = "usda_branded_food_data_upload.checkpoint"
+# Read by the assistant's PineconeRetriever to detect new uploads; keep the two in sync.
+INDEX_VERSION_NAMESPACE = "__index_version__"
+INDEX_VERSION_ID = "index-version"
 
-for _, row in df.iterrows():
-    food_name = row['FOOD_NAME']
-    texts.append(food_name)
-    metadata = {column: row[column] for column in df.columns if pd.notna(row[column]) and column != 'FOOD_NAME'}
-    metadata["FOOD_NAME"] = food_name
-    metadatas.append(metadata)
+def build_metadata(df):
+    # Collect the non-null cells column by column, then group them by row, instead of testing every cell of every row.
+    columns = [column for column in df.columns if column != 'FOOD_NAME'] + ['FOOD_NAME']
+    rows, column_ids, values = [], [], []
+    for column_id, column in enumerate(columns):
+        series = df[column]
+        present = np.flatnonzero(series.notna().to_numpy())
+        rows.append(present)
+        column_ids.append(np.full(len(present), column_id))
+        values.append(series.to_numpy(dtype=object)[present])
 
-batch_size = 90
-index_name = "branded-food-data"
+    rows, column_ids, values = np.concatenate(rows), np.concatenate(column_ids), np.concatenate(values)
+    order = np.lexsort((column_ids, rows))
+    boundaries = np.searchsorted(rows[order], np.arange(len(df) + 1))
+    names = np.array(columns, dtype=object)[column_ids[order]].tolist()
+    values = values[order].tolist()
+    return [dict(zip(names[start:end], values[start:end])) for start, end in zip(boundaries[:-1], boundaries[1:])]
 
-if not pc.has_index(index_name):
-    pc.create_index(
-        name=index_name,
-        dimension=1024,
-        metric="cosine",
-        spec=ServerlessSpec(
-            cloud='aws', 
-            region='us-east-1'
-        ) 
-    ) 
+def iter_record_chunks(df, pending):
+    # pending is a boolean mask over df of the records still to upload, computed once for the whole frame.
+    for start in range(0, len(df), METADATA_CHUNK_ROWS):
+        chunk = df.iloc[start:start + METADATA_CHUNK_ROWS]
+        chunk = chunk[pending[start:start + METADATA_CHUNK_ROWS]]
+        if len(chunk):
+            yield chunk['FOOD_RECORD_ID'].tolist(), chunk['FOOD_NAME'].tolist(), build_metadata(chunk)
 
-while not pc.describe_index(index_name).status['ready']:
-    time.sleep(1)
+def get_input_key(df, release):
+    # Names the input a checkpoint belongs to: the release and a hash of the records being uploaded, so IDs left by a
+    # partly failed upload are not skipped in a later release, where those records may have changed again.
+    digest = hashlib.sha256(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes()).hexdigest()[:16]
+    return f"{release or 'full'}:{digest}"
 
-index = pc.Index(index_name)
+def load_checkpoint(path, input_key):
+    # The first line holds the input key; a checkpoint written for other input is discarded and started afresh.
+    if os.path.exists(path):
+        with open(path) as file:
+            if file.readline().strip() == f"# {input_key}":
+                return {line.strip() for line in file if line.strip()}
+        print(f"Discarding {path}, which was written for different input.")
+    with open(path, 'w') as file:
+        file.write(f"# {input_key}\n")
+    return set()
 
-def generate_embeddings_with_retry(pc, text_batch, max_retries=5):
+def with_retry(action, description, max_retries):
     for attempt in range(max_retries):
         try:
-            embeddings = pc.inference.embed(
-                model="multilingual-e5-large",
-                inputs=text_batch,
-                parameters={"input_type": "passage", "truncate": "END"}
-            )
-            return embeddings
+            return action()
         except Exception as e:
-            print(f"Embedding generation failed on attempt {attempt + 1}: {e}")
+            print(f"{description} failed on attempt {attempt + 1}: {e}")
             if attempt < max_retries - 1:
                 time.sleep(2 ** attempt)
+    print(f"Max retries for {description.lower()} reached.")
+    return None
+
+class PineconeEmbedder:
+    def __init__(self, pc):
+        self.pc = pc
+
+    def embed(self, texts):
+        embeddings = self.pc.inference.embed(
+            model=EMBEDDING_MODEL,
+            inputs=texts,
+            parameters={"input_type": "passage", "truncate": "END"}
+        )
+        return [embedding['values'] for embedding in embeddings]
+
+class StubEmbedder:
+    # Deterministic pseudo-embeddings with simulated latency, for measuring the pipeline without Pinecone.
+    def __init__(self, latency_seconds=0.0):
+        self.latency_seconds = latency_seconds
+
+    def embed(self, texts):
+        time.sleep(self.latency_seconds)
+        seeds = [int.from_bytes(hashlib.blake2b(text.encode(), digest_size=8).digest(), 'little') for text in texts]
+        return [np.random.default_rng(seed).standard_normal(EMBEDDING_DIMENSION, dtype=np.float32).tolist() for seed in seeds]
+
+class StubIndex:
+    def __init__(self, latency_seconds=0.0):
+        self.latency_seconds = latency_seconds
+        self.namespaces = {"": {}}
+        self.vectors = self.namespaces[""]
+        self.lock = threading.Lock()
+
+    def upsert(self, vectors, namespace=""):
+        time.sleep(self.latency_seconds)
+        with self.lock:
+            self.namespaces.setdefault(namespace, {}).update({vector['id']: vector for vector in vectors})
+
+    def delete(self, ids):
+        time.sleep(self.latency_seconds)
+        with self.lock:
+            for record_id in ids:
+                self.vectors.pop(record_id, None)
+
+class IngestPipeline:
+    # Embedding and upserting run as overlapping stages on separate thread pools. At most
+    # embed_workers + upsert_workers batches are in flight, so memory stays bounded however large the input is.
+    # Batch size grows while embed calls succeed and halves when one fails, and a batch that keeps failing is split.
+    def __init__(self, embedder, index, embed_workers=4, upsert_workers=4, batch_size=MAX_BATCH_SIZE,
+                 checkpoint_path=CHECKPOINT_PATH, max_retries=5):
+        self.embedder = embedder
+        self.index = index
+        self.embed_workers = embed_workers
+        self.upsert_workers = upsert_workers
+        self.batch_size = max(MIN_BATCH_SIZE, min(batch_size, MAX_BATCH_SIZE))
+        self.checkpoint_path = checkpoint_path
+        self.max_retries = max_retries
+        self.lock = threading.Lock()
+
+    def adapt_batch_size(self, succeeded):
+        with self.lock:
+            if succeeded:
+                self.batch_size = min(self.batch_size + BATCH_SIZE_STEP, MAX_BATCH_SIZE)
             else:
-                print("Max retries for embedding generation reached. Skipping this batch.")
-                return None
-
-def upload_documents_with_retry(index, texts, metadatas, batch_size, max_retries=15):
-    for i in range(0, len(texts), batch_size):
-        text_batch = texts[i:i + batch_size]
-        metadata_batch = metadatas[i:i + batch_size]
-
-        embeddings = generate_embeddings_with_retry(pc, text_batch)
-        if embeddings is None:
-            continue
-
-        records = []
-        for j, embedding in enumerate(embeddings):
-            records.append({
-                "id": str(i + j),
-                "values": embedding['values'],
-                "metadata": metadata_batch[j]
-            })
-
-        for attempt in range(max_retries):
+                self.batch_size = max(self.batch_size // 2, MIN_BATCH_SIZE)
+
+    def embed_batch(self, ids, texts, metadatas):
+        # Returns the embedded (ids, vectors, metadatas) parts and the number of records that could not be embedded.
+        # Retrying a batch rejected for its size or for one bad record never succeeds, so after SPLIT_AFTER_ATTEMPTS
+        # failures it is split in half and each half embedded on its own, down to single records.
+        def embed():
             try:
-                index.upsert(vectors=records)
-                print(f"Uploaded {len(records)} records to Pinecone index '{index_name}' on attempt {attempt + 1}")
-                break
-            except Exception as e:
-                print(f"Attempt {attempt + 1} failed with error: {e}")
-                if attempt < max_retries - 1:
-                    time.sleep(2 ** attempt)
-                else:
-                    print("Max retries reached. Some records may not have been uploaded.")
-
-upload_documents_with_retry(index, texts, metadatas, batch_size)
\ No newline at end of file
+                vectors = self.embedder.embed(texts)
+            except Exception:
+                self.adapt_batch_size(False)
+                raise
+            self.adapt_batch_size(True)
+            return vectors
+        vectors = with_retry(embed, f"Embedding generation for {len(texts)} records", self.max_retries if len(texts) == 1 else SPLIT_AFTER_ATTEMPTS)
+        if vectors is not None:
+            return [(ids, vectors, metadatas)], 0
+        if len(texts) == 1:
+            return [], 1
+        half = len(texts) // 2
+        first_parts, first_failed = self.embed_batch(ids[:half], texts[:half], metadatas[:half])
+        second_parts, second_failed = self.embed_batch(ids[half:], texts[half:], metadatas[half:])
+        return first_parts + second_parts, first_failed + second_failed
+
+    def upsert_batch(self, ids, vectors, metadatas):
+        records = [{"id": record_id, "values": values, "metadata": metadata} for record_id, values, metadata in zip(ids, vectors, metadatas)]
+        return with_retry(lambda: self.index.upsert(vectors=records) or True, "Upsert", self.max_retries * 3)
+
+    def iter_batches(self, chunks):
+        pending_ids, pending_texts, pending_metadatas = [], [], []
+        for ids, texts, metadatas in chunks:
+            pending_ids += ids
+            pending_texts += texts
+            pending_metadatas += metadatas
+            while len(pending_ids) >= self.batch_size:
+                size = self.batch_size
+                yield pending_ids[:size], pending_texts[:size], pending_metadatas[:size]
+                pending_ids, pending_texts, pending_metadatas = pending_ids[size:], pending_texts[size:], pending_metadatas[size:]
+        if pending_ids:
+            yield pending_ids, pending_texts, pending_metadatas
+
+    def run(self, chunks, total):
+        start = time.perf_counter()
+        last_report = start
+        uploaded, failed = 0, 0
+        embedding, upserting = {}, {}
+
+        with ThreadPoolExecutor(self.embed_workers) as embed_pool, ThreadPoolExecutor(self.upsert_workers) as upsert_pool, \
+                open(self.checkpoint_path, 'a') as checkpoint:
+            def collect(block):
+                nonlocal uploaded, failed, last_report
+                done, _ = wait(list(embedding) + list(upserting), timeout=None if block else 0, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future in embedding:
+                        embedding.pop(future)
+                        parts, embed_failed = future.result()
+                        failed += embed_failed
+                        for ids, vectors, metadatas in parts:
+                            upserting[upsert_pool.submit(self.upsert_batch, ids, vectors, metadatas)] = ids
+                    else:
+                        ids = upserting.pop(future)
+                        if future.result() is None:
+                            failed += len(ids)
+                            continue
+                        checkpoint.write(''.join(f"{record_id}\n" for record_id in ids))
+                        checkpoint.flush()
+                        uploaded += len(ids)
+
+                now = time.perf_counter()
+                if now - last_report >= PROGRESS_INTERVAL_SECONDS:
+                    last_report = now
+                    print(f"Uploaded {uploaded}/{total} records ({uploaded / (now - start):.0f} records/s, batch size {self.batch_size})")
+
+            for batch in self.iter_batches(chunks):
+                while len(embedding) + len(upserting) >= self.embed_workers + self.upsert_workers:
+                    collect(block=True)
+                embedding[embed_pool.submit(self.embed_batch, *batch)] = batch
+                collect(block=False)
+            while embedding or upserting:
+                collect(block=True)
+
+        elapsed = time.perf_counter() - start
+        print(f"Uploaded {uploaded} records in {elapsed:.1f} s ({uploaded / max(elapsed, 1e-9):.0f} records/s); {failed} failed.")
+        return uploaded, failed
+
+def delete_documents_with_retry(index, ids, batch_size=1000, max_retries=15):
+    for i in range(0, len(ids), batch_size):
+        id_batch = ids[i:i + batch_size]
+        if with_retry(lambda: index.delete(ids=id_batch) or True, "Delete", max_retries):
+            print(f"Deleted {len(id_batch)} records from Pinecone index '{INDEX_NAME}'")
+
+def write_index_version(index, release):
+    # In-place updates leave the vector count unchanged, so every upload that touched the index writes a fresh version
+    # record. It lives in its own namespace, which searches of the default namespace never return.
+    version = f"{release or 'full'}:{uuid.uuid4().hex[:12]}"
+    record = {
+        "id": INDEX_VERSION_ID,
+        "values": [1.0] + [0.0] * (EMBEDDING_DIMENSION - 1),
+        "metadata": {"version": version, "release": release or "", "uploaded_at": time.time()},
+    }
+    if with_retry(lambda: index.upsert(vectors=[record], namespace=INDEX_VERSION_NAMESPACE) or True, "Index version update", 5):
+        print(f"Index version set to {version}.")
+
+def connect_to_index(pc):
+    from pinecone import ServerlessSpec
+
+    if not pc.has_index(INDEX_NAME):
+        pc.create_index(
+            name=INDEX_NAME,
+            dimension=EMBEDDING_DIMENSION,
+            metric="cosine",
+            spec=ServerlessSpec(
+                cloud='aws',
+                region='us-east-1'
+            )
+        )
+
+    while not pc.describe_index(INDEX_NAME).status['ready']:
+        time.sleep(1)
+
+    return pc.Index(INDEX_NAME)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Embed usda_branded_food_data.csv and upsert it into the Pinecone index.")
+    parser.add_argument("--changes", default=None,
+                        help="Changes manifest written by the pipeline's --incremental mode; only the listed records are upserted or deleted.")
+    parser.add_argument("--embed-workers", type=int, default=4, help="Concurrent embedding requests.")
+    parser.add_argument("--upsert-workers", type=int, default=4, help="Concurrent upsert requests.")
+    parser.add_argument("--batch-size", type=int, default=MAX_BATCH_SIZE, help=f"Initial records per batch ({MIN_BATCH_SIZE}-{MAX_BATCH_SIZE}), adapted as requests succeed or fail.")
+    parser.add_argument("--checkpoint", default=None,
+                        help=f"File of uploaded FOOD_RECORD_IDs used to resume an interrupted run (default {CHECKPOINT_PATH}, or <changes>.checkpoint).")
+    parser.add_argument("--restart", action="store_true", help="Ignore an existing checkpoint and upload every record.")
+    parser.add_argument("--stub", action="store_true", help="Use an in-memory stub embedder and index instead of Pinecone.")
+    parser.add_argument("--stub-latency-ms", type=float, default=0.0, help="Simulated latency of each stub request.")
+    args = parser.parse_args()
+
+    deleted_ids, release = [], None
+    if args.changes:
+        with open(args.changes) as file:
+            changes = json.load(file)
+        # Typed, so a release with nothing to upsert loads an empty frame instead of failing to match string against null.
+        df = load_food_data(filter=ds.field('FOOD_RECORD_ID').isin(pa.array(changes['upserted'], type=pa.string())), restore_decimals=True)
+        deleted_ids, release = changes['deleted'], changes['release']
+    else:
+        df = load_food_data(restore_decimals=True)
+    df = df.astype({'FOOD_SERVING_SIZE': object})
+
+    if args.stub:
+        embedder, index = StubEmbedder(args.stub_latency_ms / 1000), StubIndex(args.stub_latency_ms / 1000)
+    else:
+        from pinecone.grpc import PineconeGRPC as Pinecone
+        pc = Pinecone()
+        embedder, index = PineconeEmbedder(pc), connect_to_index(pc)
+
+    checkpoint_path = args.checkpoint or (f"{args.changes}.checkpoint" if args.changes else CHECKPOINT_PATH)
+    if args.restart and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    completed_ids = load_checkpoint(checkpoint_path, get_input_key(df, release))
+    if completed_ids:
+        print(f"Resuming from {checkpoint_path}: {len(completed_ids)} records already uploaded.")
+
+    delete_documents_with_retry(index, deleted_ids)
+    pipeline = IngestPipeline(embedder, index, args.embed_workers, args.upsert_workers, args.batch_size, checkpoint_path)
+    pending = ~df['FOOD_RECORD_ID'].isin(completed_ids).to_numpy()
+    uploaded, failed = pipeline.run(iter_record_chunks(df, pending), int(pending.sum()))
+    if uploaded or deleted_ids:
+        write_index_version(index, release)
+
+    if failed:
+        print(f"{failed} records were not uploaded; rerun to retry them from {checkpoint_path}.")
+    else:
+        # A completed run leaves nothing to resume, so the next full reindex starts from scratch.
+        os.remove(checkpoint_path)